@@ -0,0 +1,91 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class TokenCache:
+    """
+    Token key to user mapping: a process-local LRU whose entries live for
+    TOKEN_CACHE_TTL seconds, optionally in front of a shared Django cache.
+    Signals drop a key in the process that made the change and in the
+    shared cache; other processes keep their local entry until the TTL.
+    """
+    prefix = 'auth-token'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    @property
+    def shared(self):
+        alias = settings.TOKEN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def get_key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return copy.copy(entry[1])
+                del self._entries[key]
+        if self.shared is None:
+            return None
+        user = self.shared.get(self.get_key(key))
+        if user is not None:
+            self._remember(key, user, now)
+        return user
+
+    def _remember(self, key, user, now):
+        with self._lock:
+            self._entries[key] = (now + settings.TOKEN_CACHE_TTL,
+                                  copy.copy(user))
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def set(self, key, user):
+        self._remember(key, user, time.monotonic())
+        if self.shared is not None:
+            self.shared.set(self.get_key(key), user,
+                            settings.TOKEN_CACHE_TIMEOUT)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete_many([self.get_key(key) for key in keys])
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that skips the token and user query for keys seen
+    recently. The cache is invalidated by api.signals when a token is
+    deleted and when its user is saved, e.g. on a password change or
+    deactivation.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, self.get_model()(key=key, user=user)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery, Value
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from api.filters import RECIPE_ORDERINGS
+from recipes.models import Recipe, ResourceVersion
+from users.models import Follow
+
+
+def conditional(*resources, get_state=None):
+    """Conditional GET for viewset methods, keyed by resource versions."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            versions = ResourceVersion.objects.get_versions(resources)
+            parts = [request.get_full_path()]
+            last_modified = None
+            for resource in resources:
+                version, updated_at = versions.get(resource, (0, None))
+                parts.append(f'{resource}:{version}')
+                if updated_at and (last_modified is None
+                                   or updated_at > last_modified):
+                    last_modified = updated_at
+            if get_state is not None:
+                state = get_state(self, request, **kwargs)
+                if state is None:
+                    return method(self, request, *args, **kwargs)
+                state_parts, state_modified = state
+                parts.extend(str(part) for part in state_parts)
+                if last_modified is None or state_modified > last_modified:
+                    last_modified = state_modified
+            etag = quote_etag(
+                hashlib.md5('|'.join(parts).encode()).hexdigest())
+            timestamp = (int(last_modified.timestamp())
+                         if last_modified else None)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if timestamp is not None:
+                    response['Last-Modified'] = http_date(timestamp)
+                patch_vary_headers(response, ('Authorization',))
+            return response
+        return wrapper
+    return decorator
+
+
+def get_recipe_state(view, request, pk=None):
+    """ETag parts: recipe change time, user flags, author version."""
+    user = request.user
+    author_versions = ResourceVersion.objects.of_user(OuterRef('author_id'))
+    queryset = Recipe.objects.with_user_flags(user).filter(pk=pk).annotate(
+        author_version=Subquery(author_versions.values('version')),
+        author_updated_at=Subquery(author_versions.values('updated_at'))
+    )
+    if user.is_authenticated:
+        queryset = queryset.annotate(subscribed=Exists(Follow.objects.filter(
+            user=user, author=OuterRef('author'))))
+    else:
+        queryset = queryset.annotate(subscribed=Value(False))
+    state = queryset.values_list(
+        'updated_at', 'favorited', 'in_shopping_cart', 'subscribed',
+        'author_version', 'author_updated_at').first()
+    if state is None:
+        return None
+    *parts, author_updated_at = state
+    return parts, max(parts[0], author_updated_at or parts[0])
+
+
+class RecipeListCache:
+    """Anonymous recipe lists keyed by tag, author and ordering generations."""
+    prefix = 'recipe-list'
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPE_LIST_CACHE_ALIAS]
+
+    def get_scopes(self, params):
+        scopes = [f'tag:{slug}' for slug in sorted(set(params.getlist(
+            'tags')))]
+        scopes.extend(f'author:{author}' for author in sorted(set(
+            params.getlist('author'))))
+        orderings = [f'ordering:{ordering}' for ordering in sorted(set(
+            params.getlist('ordering'))) if ordering in RECIPE_ORDERINGS]
+        return ['epoch'] + (scopes or ['all']) + orderings
+
+    def get_generations(self, scopes):
+        keys = [f'{self.prefix}:gen:{scope}' for scope in scopes]
+        generations = self.cache.get_many(keys)
+        for key in keys:
+            if key not in generations:
+                self.cache.add(key, time.time_ns(), None)
+                generations[key] = self.cache.get(key)
+        return [generations[key] for key in keys]
+
+    def get_key(self, request):
+        params = request.query_params
+        normalized = sorted(
+            (name, sorted(params.getlist(name))) for name in params)
+        scopes = self.get_scopes(params)
+        raw = json.dumps([
+            request.scheme, request.get_host(), request.path, normalized,
+            scopes, self.get_generations(scopes)
+        ])
+        return f'{self.prefix}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def _count(self, name):
+        key = f'{self.prefix}:stats:{name}'
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.add(key, 0, None)
+            self.cache.incr(key)
+
+    def get(self, request):
+        """Returns the cache key and the cached data or None."""
+        key = self.get_key(request)
+        data = self.cache.get(key)
+        self._count('misses' if data is None else 'hits')
+        return key, data
+
+    def set(self, key, data):
+        self.cache.set(key, data, settings.RECIPE_LIST_CACHE_TIMEOUT)
+
+    def invalidate(self, tag_slugs=(), author_ids=(), orderings=(),
+                   everything=False):
+        """Moves the generations once the transaction commits."""
+        scopes = [f'tag:{slug}' for slug in tag_slugs]
+        scopes.extend(f'author:{author_id}' for author_id in author_ids)
+        if everything:
+            scopes.append('epoch')
+        elif scopes:
+            scopes.append('all')
+        scopes.extend(f'ordering:{ordering}' for ordering in orderings)
+        transaction.on_commit(partial(
+            self.cache.set_many,
+            {f'{self.prefix}:gen:{scope}': time.time_ns()
+             for scope in scopes},
+            None
+        ))
+
+    def get_stats(self):
+        stats = self.cache.get_many(
+            [f'{self.prefix}:stats:hits', f'{self.prefix}:stats:misses'])
+        return {
+            'hits': stats.get(f'{self.prefix}:stats:hits', 0),
+            'misses': stats.get(f'{self.prefix}:stats:misses', 0),
+        }
+
+
+recipe_list_cache = RecipeListCache()
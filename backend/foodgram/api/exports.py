@@ -0,0 +1,84 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils import timezone
+
+from api.pdf_generator import get_content_hash, render_pdf
+from recipes.models import ShoppingListExport
+
+
+def get_expiry():
+    return timezone.now() + timedelta(
+        seconds=settings.SHOPPING_LIST_EXPORT_TTL)
+
+
+def start_export(rows):
+    """
+    Queues a PDF render of the rows or returns the job already made for the
+    same content, prolonging its lifetime and retrying it after a failure.
+    """
+    content_hash = get_content_hash(rows)
+    expires_at = get_expiry()
+    job, created = ShoppingListExport.objects.get_or_create(
+        content_hash=content_hash,
+        defaults={'rows': rows, 'expires_at': expires_at}
+    )
+    if created:
+        return job
+    changes = {'expires_at': expires_at}
+    if job.status == ShoppingListExport.FAILED:
+        changes.update(status=ShoppingListExport.PENDING, error='',
+                       started_at=None, finished_at=None)
+    ShoppingListExport.objects.filter(pk=job.pk).update(**changes)
+    for field, value in changes.items():
+        setattr(job, field, value)
+    return job
+
+
+def claim_job():
+    """
+    Takes the oldest pending job, or a running one whose worker has died.
+    The conditional update lets several workers share the queue.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.SHOPPING_LIST_EXPORT_TIMEOUT)
+    candidates = ShoppingListExport.objects.filter(
+        Q(status=ShoppingListExport.PENDING)
+        | Q(status=ShoppingListExport.RUNNING, started_at__lte=stale)
+    ).order_by('created_at').values_list('pk', 'status', 'started_at')[:10]
+    for pk, status, started_at in candidates:
+        claimed = ShoppingListExport.objects.filter(
+            pk=pk, status=status, started_at=started_at
+        ).update(status=ShoppingListExport.RUNNING, started_at=now)
+        if claimed:
+            return ShoppingListExport.objects.get(pk=pk)
+    return None
+
+
+def process_job(job):
+    try:
+        content = render_pdf(job.rows)
+    except Exception as error:
+        job.status = ShoppingListExport.FAILED
+        job.error = str(error)
+    else:
+        job.file.save(f'{job.content_hash}.pdf', ContentFile(content),
+                      save=False)
+        job.status = ShoppingListExport.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=('status', 'file', 'error', 'finished_at'))
+
+
+def purge_expired():
+    """Deletes expired jobs with their files; returns the number deleted."""
+    deleted = 0
+    for job in ShoppingListExport.objects.expired().only('pk', 'file'):
+        count, _ = ShoppingListExport.objects.expired().filter(
+            pk=job.pk).delete()
+        if count:
+            if job.file:
+                job.file.delete(save=False)
+            deleted += count
+    return deleted
@@ -1,36 +1,105 @@
+from django import forms
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe, Tag
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.search import ingredient_index, search_ingredients, tag_slug_index
+
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+
+
+def get_tag_choices():
+    return tag_slug_index.choices()
+
+
+class IdListField(forms.TypedMultipleChoiceField):
+    """Accepts any list of positive integer ids without a choices query."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('coerce', int)
+        super().__init__(*args, **kwargs)
+
+    def valid_value(self, value):
+        return str(value).isdigit()
+
+
+class IdListFilter(rest_framework.MultipleChoiceFilter):
+    field_class = IdListField
 
 
 class RecipeFilter(rest_framework.FilterSet):
-    author = rest_framework.AllValuesMultipleFilter(field_name='author__id')
-    tags = rest_framework.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
-        to_field_name='slug'
+    """
+    Filters use column lookups and subqueries instead of joins, so no
+    recipe is repeated and the queryset needs no distinct().
+    """
+    author = IdListFilter(method='get_author')
+    tags = rest_framework.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='get_tags'
     )
     is_favorited = rest_framework.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = rest_framework.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    ordering = rest_framework.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='get_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author__id', 'tags__slug', 'is_favorited',
-                  'is_in_shopping_cart')
+        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'ordering')
+
+    def get_author(self, queryset, name, value):
+        return queryset.filter(author_id__in=value)
+
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            tag_id__in=tag_slug_index.get_ids(value),
+            recipe_id=OuterRef('pk')
+        )))
+
+    def filter_by_user(self, queryset, model, value):
+        user = self.request.user
+        if not value:
+            return queryset
+        if not user.is_authenticated:
+            return queryset.none()
+        # A user's links are few, so the planner should start from them:
+        # an uncorrelated IN lets it, a correlated EXISTS may scan recipes.
+        return queryset.filter(pk__in=model.objects.filter(
+            user=user).values('recipe_id'))
 
     def get_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(is_favorited__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(cart_recipe__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, ShoppingCart, value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
 
 
-class IngredientFilter(SearchFilter):
+class IngredientFilter(BaseFilterBackend):
+    """
+    Answers name prefix queries from the in-memory ingredient index.
+    With ?search_mode=fuzzy substring and similar names are returned too.
+    """
     search_param = 'name'
+    mode_param = 'search_mode'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or view.action != 'list':
+            return queryset
+        if request.query_params.get(self.mode_param) == 'fuzzy':
+            return search_ingredients(queryset, query,
+                                      settings.INGREDIENT_SEARCH_LIMIT)
+        return ingredient_index.prefix(query,
+                                       settings.INGREDIENT_SEARCH_LIMIT)
@@ -0,0 +1,168 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.depth = 0
+
+
+class QueryRecorder:
+    """Execute wrapper counting queries and their time; works without DEBUG."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.metrics.db_time += time.perf_counter() - start
+            self.metrics.queries += 1
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect_left(BUCKETS_MS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def as_dict(self):
+        bounds = [str(bound) for bound in BUCKETS_MS] + ['+Inf']
+        return {
+            'count': self.count,
+            'sum': round(self.total, 3),
+            'buckets': dict(zip(bounds, self.buckets)),
+        }
+
+
+class MetricsRegistry:
+    """Histograms per view and action, kept in the process memory."""
+    fields = ('duration_ms', 'db_ms', 'serializer_ms', 'queries', 'bytes')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, name, **values):
+        with self._lock:
+            histograms = self._views.get(name)
+            if histograms is None:
+                histograms = self._views[name] = {
+                    field: Histogram() for field in self.fields}
+            for field, value in values.items():
+                histograms[field].observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {field: histogram.as_dict()
+                       for field, histogram in histograms.items()}
+                for name, histograms in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry()
+
+
+class TimedSerializerMixin:
+    """Adds the time of top-level to_representation calls to the request."""
+
+    def to_representation(self, instance):
+        metrics = _current_metrics.get()
+        if metrics is None or metrics.depth:
+            return super().to_representation(instance)
+        metrics.depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.depth -= 1
+
+
+def get_view_name(request, view_func):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return None
+    method = request.method.lower()
+    action = (getattr(view_func, 'actions', None) or {}).get(method, method)
+    return f'{view_class.__name__}.{action}'
+
+
+class InstrumentationMiddleware:
+    """
+    Records SQL queries, database and serializer time and the response
+    size per view and action. The Server-Timing header is added with
+    DEBUG, or for staff users when SERVER_TIMING_HEADER is on.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(QueryRecorder(metrics)))
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        duration = (time.perf_counter() - start) * 1000
+        db_time = metrics.db_time * 1000
+        serializer_time = metrics.serializer_time * 1000
+
+        name = getattr(request, '_instrumentation_view', None)
+        if name is not None:
+            size = (int(response.get('Content-Length', 0))
+                    if response.streaming else len(response.content))
+            registry.record(
+                name, duration_ms=duration, db_ms=db_time,
+                serializer_ms=serializer_time, queries=metrics.queries,
+                bytes=size
+            )
+        if self.shows_timing(request):
+            response['Server-Timing'] = (
+                f'db;dur={db_time:.2f};desc="{metrics.queries} queries", '
+                f'serializer;dur={serializer_time:.2f}, '
+                f'total;dur={duration:.2f}'
+            )
+        return response
+
+    def shows_timing(self, request):
+        if settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return settings.SERVER_TIMING_HEADER and bool(user and user.is_staff)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumentation_view = get_view_name(request, view_func)
@@ -0,0 +1,333 @@
+import json
+import statistics
+import subprocess
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.pdf_generator import get_pdf, render_pdf
+from api.renderers import SHOPPING_LIST_RENDERERS
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.search import ingredient_index, search_ingredients
+from users.models import Follow
+
+SHOPPING_LIST_SIZES = (10, 100, 1000)
+INGREDIENT_PREFIXES = ('с', 'са', 'сах', 'молоко')
+INGREDIENT_QUERIES = ('сахар', 'малоко', 'варенье')
+RECIPE_EDIT_SIZES = (10, 40)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def summarize(timings):
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p90_ms': round(percentile(timings, 90), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+    }
+
+
+def time_calls(function, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def make_shopping_list(size):
+    return [{'name': f'Ингредиент {index}', 'measurement_unit': 'г',
+             'amount': index + 1} for index in range(size)]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа и количество SQL-запросов основных '
+            'эндпоинтов API и сохраняет результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--label', default='',
+                            help='Метка прогона, например имя ветки.')
+        parser.add_argument('--render-iterations', type=int, default=10,
+                            help='Повторов для замеров отрисовки списков.')
+        parser.add_argument('--deep-page', type=int, default=1000,
+                            help='Номер страницы для замера глубокой '
+                                 'пагинации.')
+
+    def get_user(self):
+        """The first user with a cart, or with subscriptions if none."""
+        cart_user = ShoppingCart.objects.values('user').order_by(
+            'user').first()
+        follow_user = Follow.objects.values('user').order_by('user').first()
+        user_id = (cart_user or follow_user or {}).get('user')
+        if user_id is None:
+            raise CommandError('Нет данных: запустите generate_data.')
+        return user_id
+
+    def get_endpoints(self, user_id):
+        recipe_id = Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first()
+        tags = '&'.join(f'tags={slug}' for slug in Tag.objects.values_list(
+            'slug', flat=True)[:2])
+        author_id = Favorite.objects.filter(user=user_id).values_list(
+            'recipe__author', flat=True).first()
+        filtered = f'/api/recipes/?{tags}&is_favorited=1'
+        return {
+            'recipe_list_anonymous': ('/api/recipes/', False),
+            'recipe_list': ('/api/recipes/', True),
+            'recipe_list_cursor': ('/api/recipes/?pagination=cursor', True),
+            'recipe_list_tags': (f'/api/recipes/?{tags}', True),
+            'recipe_list_filtered': (filtered, True),
+            'recipe_list_filtered_author': (
+                f'{filtered}&author={author_id}', True),
+            'recipe_detail': (f'/api/recipes/{recipe_id}/', True),
+            'subscriptions': (
+                '/api/users/subscriptions/?recipes_limit=3', True),
+            'ingredient_search': ('/api/ingredients/?name=са', False),
+            'ingredient_search_fuzzy': (
+                '/api/ingredients/?name=варенье&search_mode=fuzzy', False),
+            'download_shopping_cart': (
+                '/api/recipes/download_shopping_cart/', True),
+            'download_shopping_cart_json': (
+                '/api/recipes/download_shopping_cart/?format=json', True),
+        }
+
+    def measure(self, client, url, iterations, warmup):
+        for _ in range(warmup):
+            client.get(url)
+        timings, query_counts, sizes = [], [], []
+        status_code = None
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                content = (b''.join(response.streaming_content)
+                           if response.streaming else response.content)
+                timings.append((time.perf_counter() - start) * 1000)
+            query_counts.append(len(queries))
+            sizes.append(len(content))
+            status_code = response.status_code
+        return {
+            'url': url,
+            'status': status_code,
+            **summarize(timings),
+            'queries': max(query_counts),
+            'bytes': max(sizes),
+        }
+
+    def measure_shopping_lists(self, iterations):
+        """
+        Rendering time of every shopping-list format by list size; the
+        PDF is measured both cold and from the content-hash cache.
+        """
+        results = {}
+        for size in SHOPPING_LIST_SIZES:
+            rows = make_shopping_list(size)
+            get_pdf(rows)
+            results[f'items_{size}'] = {
+                'pdf': time_calls(partial(render_pdf, rows), iterations),
+                'pdf_cached': time_calls(partial(get_pdf, rows), iterations),
+                **{
+                    renderer.format: time_calls(
+                        partial(renderer().render_rows, rows), iterations)
+                    for renderer in SHOPPING_LIST_RENDERERS
+                    if renderer.format != 'pdf'
+                },
+            }
+        return results
+
+    def measure_ingredient_prefixes(self, iterations):
+        """In-memory prefix index against the ORM istartswith query."""
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        ingredient_index.prefix('', 1)
+        results = {}
+        for prefix in INGREDIENT_PREFIXES:
+            queryset = Ingredient.objects.filter(
+                name__istartswith=prefix).order_by('name')
+            results[prefix] = {
+                'index': time_calls(
+                    partial(ingredient_index.prefix, prefix, limit),
+                    iterations),
+                'orm': time_calls(
+                    lambda queryset=queryset: list(queryset[:limit]),
+                    iterations),
+            }
+        return results
+
+    def measure_ingredient_search(self, iterations):
+        """
+        Ranked fuzzy search as the API runs it: the pg_trgm query on
+        PostgreSQL, the in-process index elsewhere. The index is timed
+        on its own as well for comparison.
+        """
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        ingredient_index.prefix('', 1)
+        results = {}
+        for query in INGREDIENT_QUERIES:
+            results[query] = {
+                connection.vendor: time_calls(
+                    lambda query=query: list(search_ingredients(
+                        Ingredient.objects.all(), query, limit)),
+                    iterations),
+                'index': time_calls(
+                    partial(ingredient_index.search, query, limit),
+                    iterations),
+            }
+        return results
+
+    def measure_deep_pages(self, client, page, iterations, warmup):
+        """
+        The same deep recipe list page in every pagination mode. The
+        cursor mode has no page numbers, so its URL is reached by
+        following the next links from the first page.
+        """
+        url = '/api/recipes/?pagination=cursor'
+        for _ in range(page - 1):
+            url = client.get(url).json()['next']
+            if url is None:
+                raise CommandError(f'Рецептов меньше, чем {page} страниц.')
+        return {f'page_{page}': {
+            'default': self.measure(client, f'/api/recipes/?page={page}',
+                                    iterations, warmup),
+            'nocount': self.measure(
+                client, f'/api/recipes/?pagination=nocount&page={page}',
+                iterations, warmup),
+            'cursor': self.measure(client, url, iterations, warmup),
+        }}
+
+    def measure_patches(self, client, url, payloads, iterations):
+        timings, query_counts = [], []
+        for index in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.patch(
+                    url, json.dumps(payloads[index % len(payloads)]),
+                    content_type='application/json')
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'PATCH {url}: {response.status_code}')
+            query_counts.append(len(queries))
+        return {**summarize(timings), 'queries': max(query_counts)}
+
+    def measure_recipe_edits(self, client, user_id, iterations):
+        """
+        Repeated PATCH of a recipe with N ingredients that changes one
+        amount or swaps one ingredient, as the diff-based update sees it.
+        """
+        ingredient_ids = list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True)[:max(RECIPE_EDIT_SIZES) + 1])
+        tag_ids = list(Tag.objects.values_list('id', flat=True)[:1])
+        results = {}
+        for size in RECIPE_EDIT_SIZES:
+            recipe = Recipe.objects.create(
+                author_id=user_id, name='Замер редактирования',
+                text='Описание рецепта', cooking_time=10)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                                 amount=1)
+                for ingredient_id in ingredient_ids[:size])
+            recipe.tags.set(tag_ids)
+
+            def get_payload(ids, first_amount=1):
+                return {
+                    'tags': tag_ids, 'name': 'Замер редактирования',
+                    'text': 'Описание рецепта', 'cooking_time': 10,
+                    'ingredients': [
+                        {'id': ingredient_id,
+                         'amount': first_amount if index == 0 else 1}
+                        for index, ingredient_id in enumerate(ids)
+                    ],
+                }
+
+            kept = ingredient_ids[:size - 1]
+            url = f'/api/recipes/{recipe.pk}/'
+            try:
+                results[f'ingredients_{size}'] = {
+                    'change_amount': self.measure_patches(
+                        client, url, [
+                            get_payload(kept + [ingredient_ids[size - 1]],
+                                        amount)
+                            for amount in (2, 1)
+                        ], iterations),
+                    'swap_ingredient': self.measure_patches(
+                        client, url, [
+                            get_payload(kept + [ingredient_ids[index]])
+                            for index in (size, size - 1)
+                        ], iterations),
+                }
+            finally:
+                recipe.delete()
+        return results
+
+    def write_scenario(self, name, results):
+        for case, timings in results.items():
+            line = ', '.join(f'{kind} p50 {values["p50_ms"]} мс'
+                             for kind, values in timings.items())
+            self.stdout.write(f'{name}.{case}: {line}')
+
+    def get_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], check=True,
+                capture_output=True, text=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def handle(self, *args, **options):
+        user_id = self.get_user()
+        token, _ = Token.objects.get_or_create(user_id=user_id)
+        anonymous = Client()
+        authenticated = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        for name, (url, auth) in self.get_endpoints(user_id).items():
+            results[name] = self.measure(
+                authenticated if auth else anonymous, url,
+                options['iterations'], options['warmup'])
+            self.stdout.write(
+                f'{name}: p50 {results[name]["p50_ms"]} мс, '
+                f'p99 {results[name]["p99_ms"]} мс, '
+                f'запросов {results[name]["queries"]}')
+        scenarios = {
+            'shopping_lists': self.measure_shopping_lists(
+                options['render_iterations']),
+            'ingredient_prefixes': self.measure_ingredient_prefixes(
+                options['iterations']),
+            'ingredient_search': self.measure_ingredient_search(
+                options['iterations']),
+            'recipe_edits': self.measure_recipe_edits(
+                authenticated, user_id, options['iterations']),
+            'deep_pages': self.measure_deep_pages(
+                authenticated, options['deep_page'], options['iterations'],
+                options['warmup']),
+        }
+        for name, scenario in scenarios.items():
+            self.write_scenario(name, scenario)
+        report = {
+            'label': options['label'],
+            'revision': self.get_revision(),
+            'database': connection.vendor,
+            'created_at': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'results': results,
+            'scenarios': scenarios,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f'Результаты сохранены в {options["output"]}'))
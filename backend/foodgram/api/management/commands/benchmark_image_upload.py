@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+
+from api.serializers import RecipeImageField
+from recipes.images import process_image
+
+MODES = ('base64-legacy', 'base64-streaming', 'multipart')
+
+
+def get_peak_rss():
+    """Peak resident set size of the process in KiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def make_image(path, megabytes):
+    """Writes a noise PNG of roughly the given size; noise barely packs."""
+    side = int((megabytes * 1024 * 1024 / 3) ** 0.5)
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+        path, format='PNG', compress_level=1)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пиковое потребление памяти при загрузке '
+            'изображений рецептов разными способами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[1, 5, 20],
+                            help='Размеры изображений в мегабайтах.')
+        parser.add_argument('--output', default='')
+        parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'),
+                            help='Внутренний режим: один замер.')
+
+    def run_child(self, mode, path):
+        """Measures one upload path in a fresh process."""
+        if mode == 'multipart':
+            upload = TemporaryUploadedFile('image.png', 'image/png', 0, None)
+            with open(path, 'rb') as source:
+                for chunk in iter(lambda: source.read(64 * 1024), b''):
+                    upload.write(chunk)
+            upload.size = upload.tell()
+            upload.seek(0)
+            data = upload
+        else:
+            with open(path, 'rb') as source:
+                data = ('data:image/png;base64,'
+                        + base64.b64encode(source.read()).decode())
+        baseline = get_peak_rss()
+        if mode == 'base64-legacy':
+            process_image(Base64ImageField().to_internal_value(data))
+        else:
+            RecipeImageField().to_internal_value(data)
+        self.stdout.write(json.dumps(
+            {'baseline_kib': baseline, 'peak_kib': get_peak_rss()}))
+
+    def measure(self, mode, path):
+        result = subprocess.run(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'),
+             'benchmark_image_upload', '--child', mode, path],
+            check=True, capture_output=True, text=True
+        )
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        report['delta_kib'] = report['peak_kib'] - report['baseline_kib']
+        return report
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.run_child(*options['child'])
+            return
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for megabytes in options['sizes']:
+                path = os.path.join(directory, f'{megabytes}.png')
+                make_image(path, megabytes)
+                results[megabytes] = {}
+                for mode in MODES:
+                    report = self.measure(mode, path)
+                    results[megabytes][mode] = report
+                    self.stdout.write(
+                        f'{megabytes} МБ, {mode}: пик +'
+                        f'{report["delta_kib"] // 1024} МБ '
+                        f'({report["peak_kib"] // 1024} МБ всего)')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
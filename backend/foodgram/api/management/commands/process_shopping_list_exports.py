@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.exports import claim_job, process_job, purge_expired
+from recipes.models import ShoppingListExport, TimelineBackfill
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает очередь выгрузок списков покупок в PDF, '
+            'удаляет устаревшие файлы и догружает ленты подписок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать текущую очередь и завершиться.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза между проверками пустой очереди, в секундах.'
+        )
+        parser.add_argument(
+            '--purge-interval', type=float, default=60.0,
+            help='Период удаления устаревших выгрузок, в секундах.'
+        )
+
+    def purge(self):
+        deleted = purge_expired()
+        if deleted:
+            self.stdout.write(f'Удалено устаревших выгрузок: {deleted}')
+
+    def process(self, job):
+        process_job(job)
+        if job.status == ShoppingListExport.FAILED:
+            self.stderr.write(f'Выгрузка {job.pk}: {job.error}')
+        else:
+            self.stdout.write(f'Выгрузка {job.pk} готова.')
+
+    def backfill(self):
+        backfill = TimelineBackfill.objects.claim()
+        if backfill is None:
+            return False
+        TimelineBackfill.objects.process(backfill)
+        self.stdout.write(f'Лента подписчиков автора {backfill.author_id} '
+                          f'догружена.')
+        return True
+
+    def handle(self, *args, **options):
+        self.purge()
+        purged_at = time.monotonic()
+        while True:
+            job = claim_job()
+            if job is not None:
+                self.process(job)
+            elif not self.backfill():
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+            if time.monotonic() - purged_at >= options['purge_interval']:
+                self.purge()
+                purged_at = time.monotonic()
@@ -1,28 +1,80 @@
+from django.db import IntegrityError, transaction
+from django.db.models import UniqueConstraint
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.status import HTTP_201_CREATED, HTTP_204_NO_CONTENT
 
 
+def is_unique_violation(error, model):
+    """
+    Whether the IntegrityError comes from one of the model's unique
+    constraints: by constraint name where the driver reports it, as
+    psycopg2 does, otherwise by the columns in SQLite's message.
+    """
+    constraints = [constraint for constraint in model._meta.constraints
+                   if isinstance(constraint, UniqueConstraint)]
+    diag = getattr(error.__cause__, 'diag', None)
+    name = getattr(diag, 'constraint_name', None)
+    if name is not None:
+        return name in {constraint.name for constraint in constraints}
+    table = model._meta.db_table
+    return any(
+        str(error) == 'UNIQUE constraint failed: ' + ', '.join(
+            f'{table}.{model._meta.get_field(field).column}'
+            for field in constraint.fields)
+        for constraint in constraints
+    )
+
+
 class AddDelMixin:
+    """
+    Adds or removes a user's link to a recipe or an author. Duplicates are
+    rejected by the unique constraints, so each toggle is one statement.
+    """
     model_class = None
     mixin_serializer = None
 
     def add_del(self, request, model, serializer, pk, is_user_view=False):
-        user = request.user
-        obj_1 = get_object_or_404(self.model_class, id=pk)
-        data = {'author': obj_1.id} if is_user_view else {'recipe': obj_1.id}
-        if request.method == 'POST':
-            serializer = serializer(
-                data=data,
-                context={'request': request}
-            )
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            serializer = self.mixin_serializer(obj_1)
-            return Response(data=serializer.data, status=HTTP_201_CREATED)
-        obj_2 = (get_object_or_404(model, user=user, author=obj_1)
-                 if is_user_view
-                 else get_object_or_404(model, user=user,
-                                        recipe=obj_1))
-        obj_2.delete()
-        return Response(status=HTTP_204_NO_CONTENT)
+        if request.method != 'POST':
+            lookup = {'author_id': pk} if is_user_view else {'recipe_id': pk}
+            deleted, _ = model.objects.filter(
+                user=request.user, **lookup).delete()
+            if not deleted:
+                raise Http404
+            return Response(status=HTTP_204_NO_CONTENT)
+        obj = get_object_or_404(self.model_class, id=pk)
+        serializer = serializer(
+            data={}, context={'request': request, 'object': obj})
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError as error:
+            if not is_unique_violation(error, model):
+                raise
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    serializer.unique_error_message]
+            })
+        serializer = self.mixin_serializer(obj, context={'request': request})
+        return Response(data=serializer.data, status=HTTP_201_CREATED)
+
+
+class PaginationModeMixin:
+    """
+    Lets clients opt into another pagination class with ?pagination=<mode>.
+    """
+    pagination_modes = {}
+    pagination_mode_param = 'pagination'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            mode = self.request.query_params.get(self.pagination_mode_param)
+            pagination_class = self.pagination_modes.get(
+                mode, self.pagination_class)
+            self._paginator = pagination_class() if pagination_class else None
+        return self._paginator
@@ -1,6 +1,215 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.filters import RECIPE_ORDERINGS
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class NoCountPagination(CustomPagination):
+    """
+    Page number pagination without COUNT(*): one extra row is fetched
+    to find out whether there is a next page.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1))
+            if self.page_number < 1:
+                raise InvalidPage
+        except (InvalidPage, ValueError):
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='Неверный номер страницы.'))
+        self.request = request
+        offset = (self.page_number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.page_query_param,
+                                   self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param,
+                                   self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class RecipeCursorPagination(CustomPagination):
+    """
+    Keyset pagination over (value, id) keys of the requested ordering.
+    The cursor holds the key of the row the page starts after and the
+    direction, so ties in favorites_count or trending_score neither skip
+    nor repeat recipes and deep pages cost as little as the first one.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request):
+        return RECIPE_ORDERINGS.get(request.query_params.get('ordering'),
+                                    self.ordering)
+
+    def decode_cursor(self, request, field):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, value, recipe_id = base64.urlsafe_b64decode(
+                encoded.encode()).decode().split('|')
+            value = field.to_python(value)
+            recipe_id = int(recipe_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('next', 'previous') or value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'previous', value, recipe_id
+
+    def encode_cursor(self, recipe, reverse):
+        value = getattr(recipe, self.field.attname)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        direction = 'previous' if reverse else 'next'
+        return base64.urlsafe_b64encode(
+            f'{direction}|{value}|{recipe.pk}'.encode()).decode()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        name = self.get_ordering(request)[0].lstrip('-')
+        self.field = queryset.model._meta.get_field(name)
+        cursor = self.decode_cursor(request, self.field)
+        reverse = cursor is not None and cursor[0]
+        if cursor is not None:
+            _, value, recipe_id = cursor
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{name}__{lookup}': value})
+                | Q(**{name: value, f'id__{lookup}': recipe_id}))
+        queryset = (queryset.order_by(name, 'id') if reverse
+                    else queryset.order_by(f'-{name}', '-id'))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+        self.has_next = bool(rows) and (reverse or has_more)
+        self.has_previous = bool(rows) and (
+            has_more if reverse else cursor is not None)
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.page[-1], reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.page[0], reverse=True))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class UserCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = ('-id',)
+
+
+class FeedPagination(CustomPagination):
+    """
+    Keyset pagination over (pub_date, id) keys: the cursor holds the key
+    of the last recipe on the page, so deep pages cost as little as the
+    first one.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, recipe_id = base64.urlsafe_b64decode(
+                encoded.encode()).decode().rsplit('|', 1)
+            pub_date = parse_datetime(pub_date)
+            recipe_id = int(recipe_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, recipe_id
+
+    def encode_cursor(self, key):
+        pub_date, recipe_id = key
+        return base64.urlsafe_b64encode(
+            f'{pub_date.isoformat()}|{recipe_id}'.encode()).decode()
+
+    def paginate_keys(self, request, get_keys):
+        """Calls get_keys(before, limit) and keeps one key to look ahead."""
+        page_size = self.get_page_size(request)
+        self.request = request
+        keys = get_keys(self.decode_cursor(request), page_size + 1)
+        self.next_key = (keys[page_size - 1] if len(keys) > page_size
+                         else None)
+        return keys[:page_size]
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(self.next_key))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -1,34 +1,65 @@
-from django.http.response import HttpResponse
+import hashlib
+import io
+import json
+import os
+import threading
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen.canvas import Canvas
-from reportlab.platypus import Frame, Paragraph
-
-
-def generate_pdf(obj):
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = (
-        'attachment; filename="shopping-list.pdf"')
-    canvas = Canvas(response)
-    pdfmetrics.registerFont(TTFont('DejaVuSerif', 'data/DejaVuSerif.ttf'))
-
-    style = ParagraphStyle('russian_text')
-    style.fontName = 'DejaVuSerif'
-    style.leading = 0.5 * cm
-
-    story = ['Список ингредиентов:\n\n']
-    story.extend(f'{index + 1}. {item["ingredient__name"]} '
-                 f'({item["ingredient__measurement_unit"]}) - '
-                 f'{item["amount__sum"]}\n'
-                 for index, item in enumerate(obj))
-    for i, part in enumerate(story):
-        story[i] = Paragraph(part.replace('\n', '<br></br>'), style)
-
-    frame = Frame(0, 0, 21 * cm, 29.7 * cm, leftPadding=cm, bottomPadding=cm,
-                  rightPadding=cm, topPadding=cm, )
-    frame.addFromList(story, canvas)
-    canvas.showPage()
-    canvas.save()
-    return response
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+FONT_NAME = 'DejaVuSerif'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'data', 'DejaVuSerif.ttf')
+
+_font_lock = threading.Lock()
+
+
+def register_font():
+    """Registers the cyrillic font once per process."""
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return
+    with _font_lock:
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def get_content_hash(rows):
+    content = json.dumps(rows, ensure_ascii=False, sort_keys=True,
+                         default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def render_pdf(rows):
+    register_font()
+    style = ParagraphStyle('russian_text', fontName=FONT_NAME,
+                           leading=0.5 * cm)
+    buffer = io.BytesIO()
+    document = SimpleDocTemplate(
+        buffer, pagesize=A4, leftMargin=cm, rightMargin=cm, topMargin=cm,
+        bottomMargin=cm, title='Список ингредиентов'
+    )
+    story = [Paragraph('Список ингредиентов:', style), Spacer(0, 0.5 * cm)]
+    story.extend(
+        Paragraph(escape(f'{index + 1}. {item["name"]} '
+                         f'({item["measurement_unit"]}) - '
+                         f'{item["amount"]}'), style)
+        for index, item in enumerate(rows)
+    )
+    document.build(story)
+    return buffer.getvalue()
+
+
+def get_pdf(rows):
+    """Returns rendered PDF bytes, reusing the cached copy of the same cart."""
+    key = f'shopping-list-pdf:{get_content_hash(rows)}'
+    content = cache.get(key)
+    if content is None:
+        content = render_pdf(rows)
+        cache.set(key, content, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return content
@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.http.response import FileResponse, StreamingHttpResponse
+from rest_framework import renderers
+
+from api.pdf_generator import get_content_hash, get_pdf
+from recipes.models import ShoppingListExport
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Base renderer for the aggregated shopping list rows.
+    Error responses are rendered as JSON regardless of the chosen format.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None and response.exception:
+            response['Content-Type'] = 'application/json'
+            return renderers.JSONRenderer().render(data)
+        return self.render_rows(data)
+
+    def render_rows(self, rows):
+        raise NotImplementedError
+
+    def open_rendered(self, rows):
+        """File already rendered for the rows, or None."""
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+    def render_rows(self, rows):
+        return get_pdf(rows)
+
+    def open_rendered(self, rows):
+        job = ShoppingListExport.objects.finished(
+            get_content_hash(rows)).first()
+        if job is None:
+            return None
+        try:
+            return job.file.storage.open(job.file.name, 'rb')
+        except FileNotFoundError:
+            return None
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render_rows(self, rows):
+        lines = ['Список ингредиентов:', '']
+        lines.extend(f'{index + 1}. {item["name"]} '
+                     f'({item["measurement_unit"]}) - {item["amount"]}'
+                     for index, item in enumerate(rows))
+        return '\n'.join(lines).encode(self.charset)
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    fields = ('name', 'measurement_unit', 'amount')
+
+    def render_rows(self, rows):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.fields,
+                                extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue().encode(self.charset)
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+    def render_rows(self, rows):
+        return json.dumps(rows, ensure_ascii=False).encode(self.charset)
+
+
+SHOPPING_LIST_RENDERERS = (
+    PDFShoppingListRenderer,
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
+
+
+def iter_chunks(content, chunk_size):
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+
+def shopping_list_response(renderer, rows):
+    """
+    Streams the file of a finished export from storage when there is one;
+    otherwise the content is rendered in memory and sent in chunks.
+    """
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    filename = f'shopping-list.{renderer.format}'
+    file = renderer.open_rendered(rows)
+    if file is not None:
+        response = FileResponse(file, as_attachment=True, filename=filename,
+                                content_type=content_type)
+        response.block_size = settings.SHOPPING_LIST_CHUNK_SIZE
+        return response
+    content = renderer.render_rows(rows)
+    response = StreamingHttpResponse(
+        iter_chunks(content, settings.SHOPPING_LIST_CHUNK_SIZE),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Content-Length'] = len(content)
+    return response
@@ -1,17 +1,77 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from djoser import serializers as djoser_serializers
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
-from rest_framework.validators import UniqueTogetherValidator
 
+from api.instrumentation import TimedSerializerMixin
 from api.validators import UniqueFieldsValidator
+from recipes.images import decode_base64, process_image, save_thumbnails
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListExport, ShoppingListItem,
+                            Tag)
+from recipes.signals import adding_new_recipe_tags
+from recipes.storage import recipe_storage
 from users.models import CustomUser, Follow
 
 
-class UserSerializer(djoser_serializers.UserSerializer):
+def get_recipes_limit(request):
+    limit = request.query_params.get('recipes_limit')
+    if limit and limit.isdigit() and int(limit) > 0:
+        return int(limit)
+    return None
+
+
+def get_thumbnail_urls(recipe, request):
+    """Recipes saved before the image pipeline fall back to the original."""
+    thumbnails = recipe.thumbnails
+    if not thumbnails and recipe.image:
+        thumbnails = dict.fromkeys(settings.RECIPE_THUMBNAIL_SIZES,
+                                   recipe.image.name)
+    urls = {variant: recipe_storage.url(name)
+            for variant, name in thumbnails.items()}
+    if request is None:
+        return urls
+    return {variant: request.build_absolute_uri(url)
+            for variant, url in urls.items()}
+
+
+class RecipeImageField(serializers.ImageField):
+    """
+    Image sent as a base64 string or data URL, or as a multipart file,
+    passed through the recipe image pipeline.
+    """
+
+    def to_internal_value(self, data):
+        decoded = None
+        try:
+            if isinstance(data, str):
+                data = decoded = decode_base64(data)
+            return process_image(super().to_internal_value(data))
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        finally:
+            if decoded is not None:
+                decoded.close()
+
+
+class ViewObjectDefault:
+    """The recipe or author the view has already loaded."""
+    requires_context = True
+
+    def __call__(self, serializer_field):
+        return serializer_field.context['object']
+
+
+def prepare_image(validated_data):
+    processed = validated_data.pop('image', None)
+    if processed is not None:
+        validated_data['image'] = processed.image
+        validated_data['thumbnails'] = save_thumbnails(processed.thumbnails)
+
+
+class UserSerializer(TimedSerializerMixin, djoser_serializers.UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -27,8 +87,13 @@ class UserSerializer(djoser_serializers.UserSerializer):
         }
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'subscribed'):
+            return obj.subscribed
         request = self.context.get('request')
-        return request and obj.follower.filter(author=obj.id).exists()
+        return (request and request.user.is_authenticated
+                and request.user.pk != obj.pk
+                and Follow.objects.filter(user=request.user,
+                                          author=obj).exists())
 
     def create(self, validated_data):
         user = super(UserSerializer, self).create(validated_data)
@@ -39,20 +104,15 @@ class UserSerializer(djoser_serializers.UserSerializer):
 
 class FavoriteSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    recipe = serializers.HiddenField(default=ViewObjectDefault())
+    unique_error_message = 'Рецепт уже добавлен в избранное'
 
     class Meta:
         model = Favorite
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=['user', 'recipe'],
-                message='Рецепт уже добавлен в избранное'
-            )
-        ]
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     measurement_unit = serializers.ReadOnlyField()
 
     class Meta:
@@ -61,7 +121,7 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('name', 'measurement_unit')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
@@ -79,7 +139,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     author = UserSerializer(
         read_only=True,
         default=serializers.CurrentUserDefault()
@@ -87,147 +147,249 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     ingredients = RecipeIngredientSerializer(source='recipe_ingredient',
                                              many=True)
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
+    thumbnails = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'thumbnails',
+                  'text', 'cooking_time')
+
+    def to_representation(self, instance):
+        if 'recipe_ingredient' not in getattr(
+                instance, '_prefetched_objects_cache', {}):
+            prefetch_related_objects(
+                [instance], 'tags',
+                Prefetch('recipe_ingredient',
+                         queryset=RecipeIngredient.objects.select_related(
+                             'ingredient'))
+            )
+        return super().to_representation(instance)
+
+    def get_thumbnails(self, obj):
+        return get_thumbnail_urls(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and obj.is_favorited.filter(user=request.user).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'in_shopping_cart'):
+            return obj.in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and obj.cart_recipe.filter(user=request.user).exists())
 
-    def validate(self, data):
-        tags = self.initial_data.get('tags')
-        if not tags:
-            raise serializers.ValidationError(
-                {'tags': 'Тег должен быть добавлен'}
-            )
-        tag_list = []
-        for tag in tags:
-            tag_obj = get_object_or_404(Tag, id=tag)
-            if tag_obj in tag_list:
-                raise serializers.ValidationError(
-                    {'tags': f'Тег {tag_obj.name} уже добавлен'}
-                )
-            tag_list.append(tag_obj)
-
-        recipe_ingredient = data['recipe_ingredient']
+    @staticmethod
+    def get_ids(values, errors, field, message):
+        ids = []
+        for value in values:
+            try:
+                ids.append(int(value))
+            except (TypeError, ValueError):
+                errors.setdefault(field, []).append(message.format(id=value))
+        return ids
+
+    def check_tags(self, errors):
+        tag_ids = self.get_ids(self.initial_data.get('tags') or [], errors,
+                               'tags', 'Неверный id тега: {id}')
+        if not tag_ids and 'tags' not in errors:
+            errors['tags'] = ['Тег должен быть добавлен']
+        tags = Tag.objects.in_bulk(set(tag_ids))
+        seen = set()
+        for tag_id in tag_ids:
+            if tag_id not in tags:
+                errors.setdefault('tags', []).append(
+                    f'Тег с id {tag_id} не найден')
+            elif tag_id in seen:
+                errors.setdefault('tags', []).append(
+                    f'Тег {tags[tag_id].name} уже добавлен')
+            seen.add(tag_id)
+        return [tags[tag_id] for tag_id in tag_ids if tag_id in tags]
+
+    def check_ingredients(self, recipe_ingredient, errors):
         if not recipe_ingredient:
-            raise serializers.ValidationError(
-                'Рецепт не может быть без ингредиентов'
-            )
-        ingredients_list = []
+            errors.setdefault('ingredients', []).append(
+                'Рецепт не может быть без ингредиентов')
+        ingredients = Ingredient.objects.in_bulk(
+            {item['ingredient']['id'] for item in recipe_ingredient})
+        seen = set()
         for item in recipe_ingredient:
-            item_data = list(item.values())
-            ingredient_obj = get_object_or_404(
-                Ingredient, id=item_data[0]['id'])
-            if ingredient_obj in ingredients_list:
-                raise serializers.ValidationError(
-                    {
-                        "ingredients":
-                            f'Ингредиент {ingredient_obj.name} уже добавлен'
-                    }
-                )
-            ingredients_list.append(ingredient_obj)
-            if item_data[1] < 1:
-                raise serializers.ValidationError(
-                    {
-                        "amount": {
-                            f'ingredient - {ingredient_obj.name}':
-                                settings.VALIDATOR_MESSAGE.format(
-                                    min_value=settings.MIN_INGREDIENT_AMOUNT)}
-                    }
-                )
+            ingredient_id = item['ingredient']['id']
+            ingredient = ingredients.get(ingredient_id)
+            if ingredient is None:
+                errors.setdefault('ingredients', []).append(
+                    f'Ингредиент с id {ingredient_id} не найден')
+                continue
+            if ingredient_id in seen:
+                errors.setdefault('ingredients', []).append(
+                    f'Ингредиент {ingredient.name} уже добавлен')
+            seen.add(ingredient_id)
+            if item['amount'] < settings.MIN_INGREDIENT_AMOUNT:
+                errors.setdefault('amount', {})[
+                    f'ingredient - {ingredient.name}'
+                ] = settings.VALIDATOR_MESSAGE.format(
+                    min_value=settings.MIN_INGREDIENT_AMOUNT)
+            item['ingredient'] = ingredient
 
+    def validate(self, data):
+        """A partial update checks only the fields it sends."""
+        errors = {}
+        if not self.partial or 'tags' in self.initial_data:
+            data['tags'] = self.check_tags(errors)
+        if 'recipe_ingredient' in data:
+            self.check_ingredients(data['recipe_ingredient'], errors)
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
     def add_ingredients_and_tags(self, instance, ingredients, tags):
-        ingredients_list = [
+        RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=instance,
-                ingredient=get_object_or_404(
-                    Ingredient, id=obj['ingredient']['id']),
+                ingredient=obj['ingredient'],
                 amount=obj['amount']
             ) for obj in ingredients
-        ]
-        RecipeIngredient.objects.bulk_create(ingredients_list)
-        instance.tags.set(tags)
+        )
+        with adding_new_recipe_tags(instance):
+            instance.tags.add(*tags)
+        # A new recipe cannot be in anyone's favorites or cart yet.
+        instance.favorited = instance.in_shopping_cart = False
         return instance
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('recipe_ingredient')
-        tags = self.initial_data.get('tags')
+        tags = validated_data.pop('tags')
+        prepare_image(validated_data)
         recipe = Recipe.objects.create(
             author=self.context.get('request').user,
-            image=validated_data.pop('image'),
             **validated_data
         )
         return self.add_ingredients_and_tags(recipe, ingredients, tags)
 
+    def update_ingredients(self, instance, ingredients):
+        """
+        Applies the difference between the stored and the submitted
+        ingredients; unchanged rows keep their primary keys.
+        Returns the amounts per ingredient before the update.
+        """
+        existing, old_amounts, to_delete = {}, {}, []
+        for recipe_ingredient in instance.recipe_ingredient.all():
+            ingredient_id = recipe_ingredient.ingredient_id
+            old_amounts[ingredient_id] = (old_amounts.get(ingredient_id, 0)
+                                          + recipe_ingredient.amount)
+            if ingredient_id in existing:
+                to_delete.append(recipe_ingredient.pk)
+            else:
+                existing[ingredient_id] = recipe_ingredient
+        to_create, to_update = [], []
+        for item in ingredients:
+            recipe_ingredient = existing.pop(item['ingredient'].id, None)
+            if recipe_ingredient is None:
+                to_create.append(RecipeIngredient(
+                    recipe=instance, ingredient=item['ingredient'],
+                    amount=item['amount']))
+            elif recipe_ingredient.amount != item['amount']:
+                recipe_ingredient.amount = item['amount']
+                to_update.append(recipe_ingredient)
+        to_delete.extend(
+            recipe_ingredient.pk for recipe_ingredient in existing.values())
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        return old_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('recipe_ingredient')
-        tags = self.initial_data.get('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        instance = self.add_ingredients_and_tags(instance, ingredients, tags)
+        ingredients = validated_data.pop('recipe_ingredient', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            old_amounts = self.update_ingredients(instance, ingredients)
+            new_amounts = {item['ingredient'].id: item['amount']
+                           for item in ingredients}
+            ShoppingListItem.objects.change_recipe(instance, old_amounts,
+                                                   new_amounts)
+        prepare_image(validated_data)
+        return super().update(instance, validated_data)
+
+
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = RecipeImageField(max_length=None, use_url=True)
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+    def update(self, instance, validated_data):
+        prepare_image(validated_data)
         return super().update(instance, validated_data)
 
 
-class ListRecipeSerializer(serializers.ModelSerializer):
+class ListRecipeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
+    def get_thumbnails(self, obj):
+        return get_thumbnail_urls(obj, self.context.get('request'))
+
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    recipe = serializers.HiddenField(default=ViewObjectDefault())
+    unique_error_message = 'Рецепт уже добавлен в корзину'
 
     class Meta:
         model = ShoppingCart
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=['user', 'recipe'],
-                message='Рецепт уже добавлен в корзину'
-            )
-        ]
 
 
 class FollowSerializer(UserSerializer):
-    recipes = ListRecipeSerializer(many=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta(UserSerializer.Meta):
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    def get_recipes(self, obj):
+        recipes = obj.recipes.all()
+        if 'recipes' not in getattr(obj, '_prefetched_objects_cache', {}):
+            request = self.context.get('request')
+            limit = get_recipes_limit(request) if request else None
+            recipes = recipes.order_by('-pub_date', '-id')[:limit]
+        return ListRecipeSerializer(recipes, many=True,
+                                    context=self.context).data
 
 
 class FollowerSerializer(serializers.ModelSerializer):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    author = serializers.HiddenField(default=ViewObjectDefault())
+    unique_error_message = 'Вы уже подписаны на этого автора'
 
     class Meta:
         model = Follow
         fields = ('user', 'author')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=['user', 'author'],
-                message='Вы уже подписаны на этого автора'
-            ),
-            UniqueFieldsValidator('user', 'author')
-        ]
+        validators = [UniqueFieldsValidator('user', 'author')]
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ShoppingListExport
+        fields = ('id', 'status', 'file', 'error', 'created_at',
+                  'expires_at')
+        read_only_fields = fields
@@ -0,0 +1,100 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.caching import recipe_list_cache
+from recipes.models import Favorite, Ingredient, Recipe, Tag
+from recipes.signals import recipe_ingredients_changed, trending_scores_updated
+from users.models import CustomUser
+
+
+def invalidate_recipe(recipe_id, author_id=None):
+    if author_id is None:
+        author_id = Recipe.objects.filter(pk=recipe_id).values_list(
+            'author_id', flat=True).first()
+    recipe_list_cache.invalidate(
+        Tag.objects.filter(recipes=recipe_id).values_list('slug', flat=True),
+        [author_id] if author_id else ()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def invalidate_recipe_lists(sender, instance, created=False, **kwargs):
+    if created:
+        # A new recipe has no tags yet; adding them invalidates their pages.
+        recipe_list_cache.invalidate(author_ids=[instance.author_id])
+    else:
+        invalidate_recipe(instance.pk, instance.author_id)
+
+
+@receiver(recipe_ingredients_changed, sender=Recipe)
+def invalidate_recipe_lists_on_ingredients(sender, recipe_id, **kwargs):
+    invalidate_recipe(recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_lists_on_tags(sender, instance, action, reverse,
+                                    pk_set, **kwargs):
+    if reverse:
+        recipe_list_cache.invalidate(everything=True)
+    elif action == 'pre_clear':
+        invalidate_recipe(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        recipe_list_cache.invalidate(
+            Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True),
+            [instance.author_id]
+        )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_popular_recipe_lists(sender, **kwargs):
+    recipe_list_cache.invalidate(orderings=['popular'])
+
+
+@receiver(trending_scores_updated, sender=Recipe)
+def invalidate_trending_recipe_lists(sender, **kwargs):
+    recipe_list_cache.invalidate(orderings=['trending'])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_recipe_lists_on_tag_change(sender, **kwargs):
+    recipe_list_cache.invalidate(everything=True)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_recipe_lists_on_ingredient_change(sender, created=False,
+                                                 **kwargs):
+    if not created:
+        recipe_list_cache.invalidate(everything=True)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_recipe_lists_on_user_change(sender, instance, created,
+                                           update_fields=None, **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    # Only the authors of listed recipes appear in the lists; the counter
+    # on the instance may be stale, so it is read from the database.
+    if CustomUser.objects.filter(pk=instance.pk,
+                                 recipes_count__gt=0).exists():
+        recipe_list_cache.invalidate(everything=True)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_cached_user_tokens(sender, instance, update_fields=None,
+                                  **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    token_cache.delete(*keys)
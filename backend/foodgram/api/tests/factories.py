@@ -0,0 +1,36 @@
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+
+def create_user(username, **fields):
+    return CustomUser.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        first_name='Имя', last_name='Фамилия', password='password', **fields)
+
+
+def create_tags(count):
+    return Tag.objects.bulk_create(
+        Tag(name=f'Тег {index}', color=f'#00000{index}', slug=f'tag{index}')
+        for index in range(count))
+
+
+def create_ingredients(*names, measurement_unit='г'):
+    return Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit=measurement_unit)
+        for name in names)
+
+
+def create_recipe(author, name='Рецепт', **fields):
+    fields.setdefault('text', 'Описание')
+    fields.setdefault('cooking_time', 10)
+    return Recipe.objects.create(author=author, name=name, **fields)
+
+
+def get_token_client(user):
+    client = APIClient()
+    token = Token.objects.create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
@@ -0,0 +1,69 @@
+import threading
+
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.mixins import is_unique_violation
+from api.tests.factories import create_recipe, create_user
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+
+class UniqueViolationTest(TestCase):
+    """Only the link model's own unique constraints count as duplicates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.recipe = create_recipe(cls.user)
+
+    def get_error(self, model, **fields):
+        with self.assertRaises(IntegrityError) as context:
+            with transaction.atomic():
+                model.objects.create(**fields)
+        return context.exception
+
+    def test_duplicate(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        error = self.get_error(Favorite, user=self.user, recipe=self.recipe)
+        self.assertTrue(is_unique_violation(error, Favorite))
+        self.assertFalse(is_unique_violation(error, ShoppingCart))
+
+    def test_other_constraint(self):
+        error = self.get_error(Follow, user=self.user, author=self.user)
+        self.assertFalse(is_unique_violation(error, Follow))
+
+
+class ConcurrentFavoriteTest(TransactionTestCase):
+    """The unique constraint settles two simultaneous additions."""
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.recipe = create_recipe(self.user)
+        self.token = Token.objects.create(user=self.user)
+
+    def test_same_favorite_twice(self):
+        barrier = threading.Barrier(2)
+        statuses = []
+
+        def add_favorite():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            barrier.wait()
+            try:
+                statuses.append(client.post(
+                    f'/api/recipes/{self.recipe.pk}/favorite/').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add_favorite) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(statuses), [201, 400])
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+
+from api.tests.factories import create_ingredients
+from recipes.models import Ingredient
+from recipes.search import ingredient_index, search_ingredients
+
+
+class IngredientSearchTest(TestCase):
+    """
+    Ranked search: prefix matches, then substring matches, then similar
+    names. On PostgreSQL this runs the pg_trgm query, elsewhere the
+    in-process index; both must rank the same way.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        create_ingredients('Молоко', 'Молоко сгущённое', 'Сахар',
+                           'Сахарная пудра', 'Ванильный сахар', 'Соль')
+
+    def setUp(self):
+        ingredient_index.invalidate()
+
+    def search(self, query):
+        return [ingredient.name for ingredient in search_ingredients(
+            Ingredient.objects.all(), query,
+            settings.INGREDIENT_SEARCH_LIMIT)]
+
+    def test_backend(self):
+        result = search_ingredients(Ingredient.objects.all(), 'сахар', 10)
+        self.assertEqual(hasattr(result, 'query'),
+                         connection.vendor == 'postgresql')
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(self.search('сахар'),
+                         ['Сахар', 'Сахарная пудра', 'Ванильный сахар'])
+
+    def test_typo(self):
+        self.assertEqual(self.search('малоко'), ['Молоко'])
+
+    def test_limit(self):
+        result = search_ingredients(Ingredient.objects.all(), 'с', 2)
+        self.assertEqual(len(result), 2)
+
+    def test_api(self):
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'сахор', 'search_mode': 'fuzzy'})
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['Сахар'])
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import update_last_login
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.tests.factories import create_recipe, create_user
+
+
+class RecipeDetailETagTest(TestCase):
+    """Only changes to the recipe or its author change the ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.other = create_user('author'), create_user('other')
+        cls.recipe = create_recipe(cls.author, 'Суп')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def get_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_not_modified(self):
+        response = self.client.get(self.url,
+                                   HTTP_IF_NONE_MATCH=self.get_etag())
+        self.assertEqual(response.status_code, 304)
+
+    def test_login_keeps_etag(self):
+        etag = self.get_etag()
+        update_last_login(None, self.author)
+        self.assertEqual(self.get_etag(), etag)
+
+    def test_other_user_keeps_etag(self):
+        etag = self.get_etag()
+        self.other.first_name = 'Другое'
+        self.other.save()
+        self.assertEqual(self.get_etag(), etag)
+
+    def test_author_change_changes_etag(self):
+        etag = self.get_etag()
+        self.author.first_name = 'Другое'
+        self.author.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['author']['first_name'], 'Другое')
+        self.assertNotEqual(response['ETag'], etag)
@@ -0,0 +1,73 @@
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.tests.factories import (create_ingredients, create_tags, create_user,
+                                 get_token_client)
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from users.models import Follow
+
+PAGE_SIZES = (6, 20, 100)
+
+
+class RecipeListQueriesTest(TestCase):
+    """The recipe list costs the same number of queries for any page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        tags = create_tags(3)
+        ingredients = create_ingredients(
+            *(f'Ингредиент {index}' for index in range(5)))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f'Рецепт {index}',
+                   text='Описание', cooking_time=10)
+            for index in range(max(PAGE_SIZES) + 1))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in recipes for tag in tags[:2])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in recipes for ingredient in ingredients)
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in recipes[::2])
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in recipes[::3])
+
+    def setUp(self):
+        caches['default'].clear()
+        self.anonymous = APIClient()
+        self.client = get_token_client(self.reader)
+
+    def assert_list_queries(self, client, queries):
+        for page_size in PAGE_SIZES:
+            with self.subTest(page_size=page_size):
+                with self.assertNumQueries(queries):
+                    response = client.get(
+                        '/api/recipes/', {'limit': page_size})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), page_size)
+
+    def test_anonymous_list(self):
+        # COUNT, page, then prefetches of tags, ingredients and authors.
+        self.assert_list_queries(self.anonymous, 5)
+
+    def test_authenticated_list(self):
+        # The token lookup is cached after the first request.
+        self.client.get('/api/users/me/')
+        self.assert_list_queries(self.client, 5)
+
+    def test_authenticated_flags(self):
+        response = self.client.get('/api/recipes/', {'limit': 100})
+        favorited = {recipe['id'] for recipe in response.data['results']
+                     if recipe['is_favorited']}
+        self.assertEqual(favorited, set(Favorite.objects.filter(
+            user=self.reader, recipe__in=[
+                recipe['id'] for recipe in response.data['results']]
+        ).values_list('recipe', flat=True)))
+        self.assertTrue(all(recipe['author']['is_subscribed']
+                            for recipe in response.data['results']))
@@ -0,0 +1,83 @@
+import io
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.tests.factories import create_ingredients, create_user
+from recipes.models import Favorite, Recipe, RecipeIngredient
+
+
+class RecipeListCacheTest(TestCase):
+    """Anonymous recipe lists are cached until a committed change."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author', recipes_count=2)
+        cls.first, cls.second = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f'Рецепт {index}',
+                   text='Описание', cooking_time=10)
+            for index in range(2))
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client = APIClient()
+
+    def get_names(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_invalidated_on_commit(self):
+        self.get_names()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Recipe.objects.create(author=self.author, name='Новый рецепт',
+                                  text='Описание', cooking_time=5)
+            self.assertNotIn('Новый рецепт', self.get_names())
+        for callback in callbacks:
+            callback()
+        self.assertIn('Новый рецепт', self.get_names())
+
+    def test_popular_invalidated_by_favorite(self):
+        self.assertEqual(self.get_names(ordering='popular'),
+                         ['Рецепт 1', 'Рецепт 0'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.author, recipe=self.first)
+        self.assertEqual(self.get_names(ordering='popular'),
+                         ['Рецепт 0', 'Рецепт 1'])
+
+    def test_trending_invalidated_by_update(self):
+        self.assertEqual(self.get_names(ordering='trending'),
+                         ['Рецепт 1', 'Рецепт 0'])
+        Favorite.objects.create(user=self.author, recipe=self.first)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('update_trending_scores', '--rebuild',
+                         stdout=io.StringIO())
+        self.assertEqual(self.get_names(ordering='trending'),
+                         ['Рецепт 0', 'Рецепт 1'])
+
+    def test_user_change(self):
+        reader = create_user('reader')
+        self.get_names()
+        with self.captureOnCommitCallbacks() as callbacks:
+            reader.first_name = 'Новое имя'
+            reader.save()
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.author.first_name = 'Новое имя'
+            self.author.save()
+        self.assertEqual(len(callbacks), 1)
+
+    def test_invalidated_by_ingredient_change(self):
+        ingredient, = create_ingredients('Соль')
+        RecipeIngredient.objects.create(recipe=self.first,
+                                        ingredient=ingredient, amount=5)
+        self.get_names()
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.name = 'Морская соль'
+            ingredient.save()
+        response = self.client.get('/api/recipes/')
+        names = [item['name'] for recipe in response.data['results']
+                 for item in recipe['ingredients']]
+        self.assertEqual(names, ['Морская соль'])
@@ -0,0 +1,58 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from api.tests.factories import create_user
+from recipes.models import Recipe
+
+
+class RecipeCursorPaginationTest(TestCase):
+    """Cursor pages follow the requested ordering through its ties."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        Recipe.objects.bulk_create(
+            Recipe(author=author, name=f'Рецепт {index}', text='Описание',
+                   cooking_time=10, favorites_count=index % 3,
+                   trending_score=index % 2 / 2)
+            for index in range(20))
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([recipe['id'] for recipe in response.data[
+                'results']])
+            url = response.data[link]
+        return pages
+
+    def test_orderings(self):
+        orderings = {
+            '': ('-pub_date', '-id'),
+            '&ordering=popular': ('-favorites_count', '-id'),
+            '&ordering=trending': ('-trending_score', '-id'),
+        }
+        for query, ordering in orderings.items():
+            with self.subTest(ordering=ordering):
+                expected = list(Recipe.objects.order_by(
+                    *ordering).values_list('id', flat=True))
+                pages = self.walk(
+                    f'/api/recipes/?pagination=cursor&limit=3{query}',
+                    'next')
+                self.assertEqual(sum(pages, []), expected)
+                last = self.client.get(
+                    f'/api/recipes/?pagination=cursor&limit=3{query}'
+                ).data
+                while last['next']:
+                    last = self.client.get(last['next']).data
+                back = self.walk(last['previous'], 'previous')
+                self.assertEqual(back, pages[-2::-1])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(
+            '/api/recipes/?pagination=cursor&cursor=bm9uZQ==')
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,128 @@
+import base64
+import io
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from api.tests.factories import (create_ingredients, create_recipe,
+                                 create_tags, create_user, get_token_client)
+from recipes.models import Recipe, RecipeIngredient
+
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAf'
+         'FcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg==')
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteQueriesTest(TestCase):
+    """
+    Writing a recipe costs the same for any number of ingredients, and an
+    update leaves unchanged ingredient and tag rows in place.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = create_tags(3)
+        cls.ingredients = create_ingredients(
+            *(f'Ингредиент {index}' for index in range(40)))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = get_token_client(self.author)
+        self.client.get('/api/users/me/')
+
+    def get_data(self, ingredients, amount=5):
+        return {
+            'tags': [tag.pk for tag in self.tags[:2]],
+            'ingredients': [{'id': ingredient.pk, 'amount': amount}
+                            for ingredient in ingredients],
+            'name': 'Сырники',
+            'text': 'Смешать и обжарить.',
+            'cooking_time': 20,
+            'image': IMAGE,
+        }
+
+    def test_create_queries(self):
+        for count in (1, 40):
+            with self.subTest(ingredients=count):
+                with self.assertNumQueries(19):
+                    response = self.client.post(
+                        '/api/recipes/',
+                        self.get_data(self.ingredients[:count]),
+                        format='json')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data['ingredients']), count)
+                self.assertFalse(response.data['is_favorited'])
+                self.assertFalse(response.data['author']['is_subscribed'])
+
+    def get_rows(self, recipe_id):
+        ingredients = dict(RecipeIngredient.objects.filter(
+            recipe=recipe_id).values_list('ingredient_id', 'pk'))
+        tags = dict(Recipe.tags.through.objects.filter(
+            recipe=recipe_id).values_list('tag_id', 'pk'))
+        return ingredients, tags
+
+    def test_update_keeps_unchanged_rows(self):
+        recipe_id = self.client.post(
+            '/api/recipes/', self.get_data(self.ingredients),
+            format='json').data['id']
+        ingredients, tags = self.get_rows(recipe_id)
+        data = self.get_data(self.ingredients[:39])
+        data['ingredients'][0]['amount'] = 10
+        data['tags'] = [tag.pk for tag in self.tags[1:]]
+        del data['image']
+        with self.assertNumQueries(24):
+            response = self.client.patch(f'/api/recipes/{recipe_id}/',
+                                         data, format='json')
+        self.assertEqual(response.status_code, 200)
+        new_ingredients, new_tags = self.get_rows(recipe_id)
+        self.assertEqual(new_ingredients, {
+            ingredient.pk: ingredients[ingredient.pk]
+            for ingredient in self.ingredients[:39]})
+        self.assertEqual(new_tags[self.tags[1].pk], tags[self.tags[1].pk])
+        self.assertNotIn(self.tags[0].pk, new_tags)
+        self.assertEqual(
+            RecipeIngredient.objects.get(pk=ingredients[
+                self.ingredients[0].pk]).amount, 10)
+
+    def test_partial_update(self):
+        recipe_id = self.client.post(
+            '/api/recipes/', self.get_data(self.ingredients[:2]),
+            format='json').data['id']
+        response = self.client.patch(f'/api/recipes/{recipe_id}/',
+                                     {'name': 'Творожники'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Творожники')
+        self.assertEqual(len(response.data['ingredients']), 2)
+        self.assertEqual(len(response.data['tags']), 2)
+        response = self.client.patch(f'/api/recipes/{recipe_id}/',
+                                     {'tags': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.data)
+
+    def test_oversized_image_rejected(self):
+        width = settings.RECIPE_IMAGE_MAX_SIZE[0] * 2 + 1
+        buffer = io.BytesIO()
+        Image.new('1', (width, width)).save(buffer, 'PNG')
+        data = self.get_data(self.ingredients[:1])
+        data['image'] = ('data:image/png;base64,'
+                         + base64.b64encode(buffer.getvalue()).decode())
+        response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_save_keeps_trending_score(self):
+        recipe = create_recipe(self.author, 'Сырники')
+        Recipe.objects.filter(pk=recipe.pk).update(trending_score=3)
+        recipe.name = 'Творожники'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.trending_score, 3)
@@ -0,0 +1,32 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.tests.factories import create_user, get_token_client
+
+
+@override_settings(SERVER_TIMING_HEADER=True)
+class ServerTimingTest(TestCase):
+    """Server-Timing is only sent to staff users outside of DEBUG."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.staff = create_user('staff', is_staff=True)
+
+    def get_client(self, user=None):
+        return APIClient() if user is None else get_token_client(user)
+
+    def test_hidden_from_users(self):
+        for user in (None, self.user):
+            with self.subTest(user=user):
+                response = self.get_client(user).get('/api/recipes/')
+                self.assertNotIn('Server-Timing', response)
+
+    def test_sent_to_staff(self):
+        response = self.get_client(self.staff).get('/api/recipes/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+    @override_settings(SERVER_TIMING_HEADER=False, DEBUG=True)
+    def test_sent_with_debug(self):
+        response = self.get_client().get('/api/recipes/')
+        self.assertIn('Server-Timing', response)
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+
+from django.http import FileResponse
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.exports import process_job, start_export
+from api.tests.factories import create_ingredients, create_recipe, create_user
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+URL = '/api/recipes/download_shopping_cart/'
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ShoppingListRenderersTest(TestCase):
+    """Each format is reachable by ?format= and by the Accept header."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        recipe = create_recipe(cls.user, 'Суп')
+        salt, = create_ingredients('Соль')
+        water, = create_ingredients('Вода', measurement_unit='мл')
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=salt, amount=5),
+            RecipeIngredient(recipe=recipe, ingredient=water, amount=500),
+        ])
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, **kwargs):
+        response = self.client.get(URL, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def check_formats(self, request):
+        expected = {
+            'pdf': 'application/pdf',
+            'txt': 'text/plain; charset=utf-8',
+            'csv': 'text/csv; charset=utf-8',
+            'json': 'application/json; charset=utf-8',
+        }
+        for file_format, content_type in expected.items():
+            with self.subTest(file_format=file_format):
+                response, content = self.download(**request(file_format))
+                self.assertEqual(response['Content-Type'], content_type)
+                self.assertEqual(
+                    response['Content-Disposition'],
+                    f'attachment; filename="shopping-list.{file_format}"')
+                self.assertEqual(int(response['Content-Length']),
+                                 len(content))
+                getattr(self, f'check_{file_format}')(content)
+
+    def check_pdf(self, content):
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def check_txt(self, content):
+        self.assertEqual(content.decode().splitlines(), [
+            'Список ингредиентов:', '',
+            '1. Вода (мл) - 500',
+            '2. Соль (г) - 5',
+        ])
+
+    def check_csv(self, content):
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        self.assertEqual(rows, [
+            {'name': 'Вода', 'measurement_unit': 'мл', 'amount': '500'},
+            {'name': 'Соль', 'measurement_unit': 'г', 'amount': '5'},
+        ])
+
+    def check_json(self, content):
+        self.assertEqual(json.loads(content), [
+            {'name': 'Вода', 'measurement_unit': 'мл', 'amount': 500},
+            {'name': 'Соль', 'measurement_unit': 'г', 'amount': 5},
+        ])
+
+    def test_format_parameter(self):
+        self.check_formats(lambda file_format: {
+            'data': {'format': file_format}})
+
+    def test_accept_header(self):
+        media_types = {
+            'pdf': 'application/pdf',
+            'txt': 'text/plain',
+            'csv': 'text/csv',
+            'json': 'application/json',
+        }
+        self.check_formats(lambda file_format: {
+            'HTTP_ACCEPT': media_types[file_format]})
+
+    def test_pdf_is_default(self):
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_pdf_from_finished_export(self):
+        job = start_export(list(
+            ShoppingListItem.objects.shopping_list(self.user)))
+        process_job(job)
+        response, content = self.download()
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename="shopping-list.pdf"')
+        with job.file.open('rb') as file:
+            self.assertEqual(content, file.read())
+
+    def test_unknown_format(self):
+        response = self.client.get(URL, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_anonymous_error_is_json(self):
+        response = APIClient().get(URL, {'format': 'csv'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, MetricsView, RecipeListCacheStatsView,
+                    RecipeViewSet, TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -13,6 +14,9 @@ router.register('users', UserViewSet, basename='users')
 
 
 urlpatterns = [
+    path('recipes/cache-stats/', RecipeListCacheStatsView.as_view(),
+         name='recipe-list-cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
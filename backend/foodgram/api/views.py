@@ -1,43 +1,76 @@
-from django.db.models import Sum
+from functools import partial
+
+from django.db.models import F, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.shortcuts import get_object_or_404
 from djoser import views as djoser_views
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.caching import conditional, get_recipe_state, recipe_list_cache
+from api.exports import start_export
 from api.filters import IngredientFilter, RecipeFilter
-from api.mixins import AddDelMixin
-from api.pagination import CustomPagination
-from api.pdf_generator import generate_pdf
+from api.instrumentation import registry
+from api.mixins import AddDelMixin, PaginationModeMixin
+from api.pagination import (CustomPagination, FeedPagination,
+                            NoCountPagination, RecipeCursorPagination,
+                            UserCursorPagination)
 from api.permissions import IsAdminOrAuthor
+from api.renderers import SHOPPING_LIST_RENDERERS, shopping_list_response
 from api.serializers import (FavoriteSerializer, FollowerSerializer,
                              FollowSerializer, IngredientSerializer,
-                             ListRecipeSerializer, RecipeSerializer,
-                             ShoppingCartSerializer, TagSerializer,
-                             UserSerializer)
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                             ListRecipeSerializer, RecipeImageSerializer,
+                             RecipeSerializer, ShoppingCartSerializer,
+                             ShoppingListExportSerializer, TagSerializer,
+                             UserSerializer, get_recipes_limit)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListExport, ShoppingListItem, Tag,
+                            TimelineEntry)
 from users.models import CustomUser, Follow
 
 
-class UserViewSet(djoser_views.UserViewSet, AddDelMixin):
+class UserViewSet(PaginationModeMixin, djoser_views.UserViewSet,
+                  AddDelMixin):
     serializer_class = UserSerializer
     mixin_serializer = FollowSerializer
     model_class = CustomUser
     queryset = CustomUser.objects.all()
     pagination_class = CustomPagination
+    pagination_modes = {
+        'cursor': UserCursorPagination,
+        'nocount': NoCountPagination,
+    }
 
     @action(detail=False, methods=['get'])
     def me(self, request):
         serializer = UserSerializer(request.user)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
+    def get_subscriptions_queryset(self, request):
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        limit = get_recipes_limit(request)
+        if limit:
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(), partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )).filter(row_number__lte=limit)
+        return CustomUser.objects.filter(
+            following__user=request.user
+        ).with_subscription(request.user).prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        ).order_by('-date_joined', '-id')
+
     @action(detail=False, methods=['get'])
     def subscriptions(self, request):
-        queryset = CustomUser.objects.filter(following__user=request.user)
+        queryset = self.get_subscriptions_queryset(request)
         page = self.paginate_queryset(queryset)
-        serializer = FollowSerializer(page, many=True)
+        serializer = FollowSerializer(page, many=True,
+                                      context={'request': request})
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'])
@@ -52,18 +85,59 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
     http_method_names = ['get']
     filter_backends = [IngredientFilter]
-    search_fields = ['^name']
 
+    @conditional('ingredients')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional('ingredients')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet, AddDelMixin):
+
+class RecipeViewSet(PaginationModeMixin, viewsets.ModelViewSet,
+                    AddDelMixin):
     serializer_class = RecipeSerializer
     mixin_serializer = ListRecipeSerializer
     model_class = Recipe
     queryset = Recipe.objects.all().order_by('-id')
     permission_classes = [IsAuthenticatedOrReadOnly, IsAdminOrAuthor]
     pagination_class = CustomPagination
+    pagination_modes = {
+        'cursor': RecipeCursorPagination,
+        'nocount': NoCountPagination,
+    }
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        user = self.request.user
+        return (Recipe.objects.with_user_flags(user).with_related(user)
+                .order_by('-id'))
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key, data = recipe_list_cache.get(request)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        recipe_list_cache.set(key, response.data)
+        return response
+
+    @conditional('tags', 'ingredients', get_state=get_recipe_state)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['put'],
+            permission_classes=[IsAuthenticated, IsAdminOrAuthor],
+            parser_classes=[MultiPartParser])
+    def image(self, request, pk=None):
+        recipe = self.get_object()
+        serializer = RecipeImageSerializer(recipe, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(self.get_serializer(recipe).data)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -76,14 +150,49 @@ class RecipeViewSet(viewsets.ModelViewSet, AddDelMixin):
 
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        paginator = FeedPagination()
+        keys = paginator.paginate_keys(request, partial(
+            TimelineEntry.objects.get_feed_keys, request.user))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in keys])
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for _, recipe_id in keys
+             if recipe_id in recipes],
+            many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
-        shopping_list = RecipeIngredient.objects.filter(
-            recipe__cart_recipe__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).order_by('ingredient__name').annotate(Sum('amount'))
-        return generate_pdf(shopping_list)
+        shopping_list = ShoppingListItem.objects.shopping_list(request.user)
+        return shopping_list_response(request.accepted_renderer,
+                                      list(shopping_list))
+
+    @action(detail=False, methods=['post'],
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_export(self, request):
+        shopping_list = ShoppingListItem.objects.shopping_list(request.user)
+        job = start_export(list(shopping_list))
+        serializer = ShoppingListExportSerializer(
+            job, context={'request': request})
+        return Response(
+            serializer.data,
+            status=(status.HTTP_200_OK
+                    if job.status == ShoppingListExport.DONE
+                    else status.HTTP_202_ACCEPTED)
+        )
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            url_path=r'shopping_cart_export/(?P<job_id>[0-9a-f-]{36})')
+    def shopping_cart_export_status(self, request, job_id=None):
+        job = get_object_or_404(ShoppingListExport, pk=job_id)
+        serializer = ShoppingListExportSerializer(
+            job, context={'request': request})
+        return Response(serializer.data)
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -91,3 +200,25 @@ class TagViewSet(viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
     pagination_class = None
+
+    @conditional('tags')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional('tags')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class RecipeListCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(recipe_list_cache.get_stats())
+
+
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(registry.snapshot())
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'recipes.apps.RecipesConfig',
     'users.apps.UsersConfig',
     'api.apps.ApiConfig',
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +68,9 @@ if DEBUG:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': os.path.join(BASE_DIR, 'db.sqlite3')
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            # A file lets threaded tests open their own connections.
+            'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
         }
     }
 else:
@@ -82,6 +86,14 @@ else:
     }
 
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -124,7 +136,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAdminUser',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'PAGE_SIZE': 6,
@@ -148,3 +160,40 @@ MAX_MODEL_FIELD_COLOR_LENGTH = 7
 MIN_COOKING_TIME = 1
 MIN_INGREDIENT_AMOUNT = 1
 VALIDATOR_MESSAGE = 'Число не может быть меньше {min_value}'
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_LIST_CHUNK_SIZE = 64 * 1024
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_INDEX_TTL = 60 * 5
+TAG_SLUG_INDEX_TTL = 60 * 5
+INGREDIENT_SIMILARITY_THRESHOLD = 0.3
+RECIPE_LIST_CACHE_ALIAS = 'default'
+RECIPE_LIST_CACHE_TIMEOUT = 60 * 10
+
+# Server-Timing is sent to staff users only, or to everyone with DEBUG.
+SERVER_TIMING_HEADER = False
+SHOPPING_LIST_EXPORT_TTL = 60 * 60 * 24
+SHOPPING_LIST_EXPORT_TIMEOUT = 60 * 5
+RECIPE_IMAGE_FORMAT = 'WEBP'
+RECIPE_IMAGE_QUALITY = 82
+RECIPE_IMAGE_MAX_SIZE = (1600, 1600)
+RECIPE_IMAGE_MAX_PIXELS = 4 * RECIPE_IMAGE_MAX_SIZE[0] * RECIPE_IMAGE_MAX_SIZE[1]
+RECIPE_THUMBNAIL_SIZES = {
+    'small': (320, 240),
+    'medium': (640, 480),
+}
+MEDIA_GC_GRACE_PERIOD = 60 * 60
+TRENDING_HALF_LIFE = 60 * 60 * 24
+TRENDING_WINDOW = TRENDING_HALF_LIFE * 10
+TRENDING_MIN_SCORE = 0.01
+TRENDING_WEIGHTS = {
+    'favorite': 1.0,
+    'shopping_cart': 0.5,
+}
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BATCH_SIZE = 1000
+TIMELINE_BACKFILL_SIZE = 100
+TIMELINE_BACKFILL_TIMEOUT = 60 * 10
+TOKEN_CACHE_TTL = 30
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_ALIAS = None
+TOKEN_CACHE_TIMEOUT = 60 * 5
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.utils.html import format_html
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListExport, ShoppingListItem, Tag)
+from .signals import ingredients_changing
 
 admin.site.empty_value_display = '-пусто-'
 
@@ -29,17 +30,18 @@ class IngredientAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('pk', 'author', 'name', 'get_ingredients', 'cooking_time',
-                    'get_favorite_list_size', 'get_tags')
+                    'favorites_count', 'cart_count', 'get_tags')
     list_display_links = ('name',)
     search_fields = ('name',)
     list_filter = ('name', 'author', 'tags')
     fields = ('author', 'name', 'text', 'image', 'cooking_time', 'tags',
-              'get_favorite_list_size')
-    readonly_fields = ('get_favorite_list_size',)
+              'favorites_count', 'cart_count')
+    readonly_fields = ('favorites_count', 'cart_count')
     inlines = (RecipeIngredientInline,)
 
-    def get_favorite_list_size(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+    def save_related(self, request, form, formsets, change):
+        with ingredients_changing([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
 
     def get_tags(self, obj):
         return list(obj.tags.all())
@@ -47,7 +49,6 @@ class RecipeAdmin(admin.ModelAdmin):
     def get_ingredients(self, obj):
         return list(RecipeIngredient.objects.filter(recipe=obj))
 
-    get_favorite_list_size.short_description = 'Добавления рецепта в избранное'
     get_tags.short_description = 'Теги'
     get_ingredients.short_description = 'Ингредиенты'
 
@@ -59,6 +60,19 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     search_fields = ('ingredient__name',)
     list_filter = ('ingredient',)
 
+    def save_model(self, request, obj, form, change):
+        with ingredients_changing([obj.recipe_id, form.initial.get('recipe')]):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with ingredients_changing([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = queryset.values_list('recipe_id', flat=True)
+        with ingredients_changing(list(recipe_ids)):
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
@@ -67,6 +81,21 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_filter = ('user', 'recipe')
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'ingredient', 'total_amount')
+    search_fields = ('user__username', 'ingredient__name')
+    list_filter = ('user',)
+
+
+@admin.register(ShoppingListExport)
+class ShoppingListExportAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'status', 'created_at', 'finished_at', 'expires_at')
+    list_filter = ('status',)
+    readonly_fields = ('content_hash', 'rows', 'file', 'error', 'started_at',
+                       'finished_at')
+
+
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('pk', 'name', 'get_color', 'slug')
@@ -0,0 +1,108 @@
+import binascii
+import hashlib
+import io
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image, ImageOps
+
+from recipes.storage import recipe_storage
+
+THUMBNAILS_DIR = 'recipes/thumbnails'
+
+BASE64_CHUNK_SIZE = 64 * 1024 * 4
+
+ProcessedImage = namedtuple('ProcessedImage', ('image', 'thumbnails'))
+
+
+def write_base64(file, data, start=0):
+    """Decodes the string slice by slice, skipping whitespace."""
+    tail = ''
+    for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+        chunk = tail + ''.join(data[offset:offset + BASE64_CHUNK_SIZE].split())
+        cut = len(chunk) - len(chunk) % 4
+        file.write(binascii.a2b_base64(chunk[:cut]))
+        tail = chunk[cut:]
+    if tail:
+        raise binascii.Error('Incorrect padding')
+
+
+def decode_base64(data):
+    """
+    Decodes a base64 string or data URL into a temporary file, so the
+    decoded image never has to fit in memory as one object.
+    """
+    content_type = 'application/octet-stream'
+    start = 0
+    if data.startswith('data:'):
+        start = data.find(';base64,')
+        if start < 0:
+            raise ValidationError('Некорректное изображение.')
+        content_type = data[5:start]
+        start += len(';base64,')
+    file = TemporaryUploadedFile('image', content_type, 0, None)
+    try:
+        write_base64(file, data, start)
+        file.size = file.tell()
+        file.name = f'image.{Image.open(file).format.lower()}'
+    except (binascii.Error, ValueError, OSError):
+        file.close()
+        raise ValidationError('Некорректное изображение.')
+    file.seek(0)
+    return file
+
+
+def encode(image):
+    """Encodes without metadata and names the file by its content hash."""
+    buffer = io.BytesIO()
+    image.save(buffer, format=settings.RECIPE_IMAGE_FORMAT,
+               quality=settings.RECIPE_IMAGE_QUALITY, method=4)
+    content = buffer.getvalue()
+    extension = settings.RECIPE_IMAGE_FORMAT.lower()
+    return ContentFile(
+        content, name=f'{hashlib.sha256(content).hexdigest()}.{extension}')
+
+
+def open_image(file):
+    """
+    Opens the upload lazily and refuses images above
+    RECIPE_IMAGE_MAX_PIXELS before decoding, which bounds the memory of
+    the full-size copy. JPEG is also decoded at a reduced scale.
+    """
+    file.seek(0)
+    image = Image.open(file)
+    if image.width * image.height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise ValidationError('Слишком большое изображение.')
+    image.draft('RGB', settings.RECIPE_IMAGE_MAX_SIZE)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert(
+            'RGBA' if 'A' in image.getbands()
+            or 'transparency' in image.info else 'RGB')
+    return image
+
+
+def process_image(file):
+    """
+    Caps the dimensions, drops metadata and re-encodes the upload,
+    then cuts the fixed-size thumbnails from the capped copy.
+    """
+    image = open_image(file)
+    image.thumbnail(settings.RECIPE_IMAGE_MAX_SIZE, reducing_gap=2.0)
+    image = ImageOps.exif_transpose(image)
+    thumbnails = {
+        variant: encode(ImageOps.fit(image, size, Image.LANCZOS))
+        for variant, size in settings.RECIPE_THUMBNAIL_SIZES.items()
+    }
+    return ProcessedImage(encode(image), thumbnails)
+
+
+def save_thumbnails(thumbnails):
+    """Stores the thumbnails; returns their names."""
+    return {
+        variant: recipe_storage.save(f'{THUMBNAILS_DIR}/{content.name}',
+                                     content)
+        for variant, content in thumbnails.items()
+    }
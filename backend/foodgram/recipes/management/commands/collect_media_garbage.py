@@ -0,0 +1,116 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.images import THUMBNAILS_DIR
+from recipes.models import Recipe, StoredFile
+from recipes.storage import recipe_storage
+
+MEDIA_DIRS = ('recipes/images', THUMBNAILS_DIR)
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из хранилища файлы изображений рецептов, '
+            'на которые больше не ссылается ни один рецепт.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE_PERIOD,
+            help='Не трогать файлы, изменённые за последние N секунд.'
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Пересчитать количество ссылок по рецептам.'
+        )
+        parser.add_argument(
+            '--scan', action='store_true',
+            help='Найти в каталогах файлы, которые не учтены в таблице.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько файлов будет удалено.'
+        )
+
+    def recount(self, batch_size):
+        references = Counter()
+        for recipe in Recipe.objects.only('image', 'thumbnails').iterator(
+                chunk_size=batch_size):
+            references.update(recipe.get_file_names())
+        StoredFile.objects.bulk_create(
+            (StoredFile(name=name) for name in references),
+            ignore_conflicts=True, batch_size=batch_size
+        )
+        changed = []
+        for stored in StoredFile.objects.iterator(chunk_size=batch_size):
+            if stored.refcount != references[stored.name]:
+                stored.refcount = references[stored.name]
+                changed.append(stored)
+        StoredFile.objects.bulk_update(changed, ['refcount'],
+                                       batch_size=batch_size)
+        self.stdout.write(f'Исправлено счётчиков ссылок: {len(changed)}')
+
+    def scan(self, cutoff):
+        """Registers files left on disk by uploads before the counters."""
+        names = []
+        for directory in MEDIA_DIRS:
+            if not recipe_storage.exists(directory):
+                continue
+            names.extend(
+                posixpath.join(directory, file_name)
+                for file_name in recipe_storage.listdir(directory)[1]
+                if recipe_storage.get_modified_time(
+                    posixpath.join(directory, file_name)) < cutoff
+            )
+        known = set(StoredFile.objects.filter(name__in=names).values_list(
+            'name', flat=True))
+        referenced = set()
+        for recipe in Recipe.objects.only('image', 'thumbnails').iterator():
+            referenced.update(recipe.get_file_names())
+        orphans = [name for name in names
+                   if name not in known and name not in referenced]
+        StoredFile.objects.bulk_create(
+            (StoredFile(name=name) for name in orphans),
+            ignore_conflicts=True
+        )
+        StoredFile.objects.filter(name__in=orphans).update(
+            updated_at=cutoff - timedelta(seconds=1))
+        self.stdout.write(f'Найдено неучтённых файлов: {len(orphans)}')
+
+    def collect(self, cutoff, batch_size):
+        """
+        Deletes unreferenced files batch by batch. Rows are locked, so an
+        upload of the same content waits and then writes the file anew.
+        """
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                names = list(StoredFile.objects.select_for_update().filter(
+                    refcount=0, updated_at__lt=cutoff
+                ).values_list('name', flat=True)[:batch_size])
+                if not names:
+                    return deleted
+                for name in names:
+                    recipe_storage.delete(name)
+                StoredFile.objects.filter(name__in=names).delete()
+            deleted += len(names)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        if options['recount']:
+            self.recount(options['batch_size'])
+        if options['scan']:
+            self.scan(cutoff)
+        if options['dry_run']:
+            count = StoredFile.objects.filter(
+                refcount=0, updated_at__lt=cutoff).count()
+            self.stdout.write(f'Будет удалено файлов: {count}')
+            return
+        deleted = self.collect(cutoff, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {deleted}'))
@@ -1,39 +1,138 @@
+import csv
 import json
+import os
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
-from recipes.models import Ingredient, Tag
+from recipes.models import Ingredient, ResourceVersion, Tag
+
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    """Yields items of a top-level JSON array without loading the file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started:
+                if position == len(buffer):
+                    break
+                if buffer[position] != '[':
+                    raise ValueError('Ожидается JSON-массив')
+                started = True
+                position += 1
+                continue
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+        buffer = buffer[position:]
+    if not started or buffer.strip() != ']':
+        raise ValueError('Некорректный JSON-массив')
+
+
+def iter_rows(path, fields):
+    with open(path, encoding='utf-8') as file:
+        if path.endswith('.csv'):
+            for row in csv.reader(file):
+                if row:
+                    yield dict(zip(fields, row))
+        else:
+            yield from iter_json_array(file)
+
+
+def iter_batches(rows, batch_size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
 class Command(BaseCommand):
+    help = 'Загружает справочники ингредиентов и тегов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(settings.BASE_DIR, 'data',
+                                 'ingredients.json'),
+            help='Путь к файлу ингредиентов в формате JSON или CSV.'
+        )
+        parser.add_argument(
+            '--tags',
+            default=os.path.join(settings.BASE_DIR, 'data', 'tags.json'),
+            help='Путь к файлу тегов в формате JSON или CSV.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать, что будет добавлено, не изменяя базу.'
+        )
+
+    def load(self, model, rows, fields, key_field, batch_size, dry_run):
+        """
+        Returns the numbers of added and skipped rows. Rows inserted
+        concurrently are skipped by ignore_conflicts, so the added count
+        is the growth of the table rather than the number of inserts.
+        """
+        before = model.objects.count()
+        planned = skipped = 0
+        for batch in iter_batches(rows, batch_size):
+            keys = {row[key_field] for row in batch}
+            existing = set(model.objects.filter(
+                **{f'{key_field}__in': keys}).values_list(*fields))
+            new_objects = []
+            for row in batch:
+                values = tuple(row[field] for field in fields)
+                if values in existing:
+                    skipped += 1
+                    continue
+                existing.add(values)
+                new_objects.append(model(**dict(zip(fields, values))))
+            if not dry_run:
+                model.objects.bulk_create(new_objects,
+                                          ignore_conflicts=True)
+            planned += len(new_objects)
+        if dry_run:
+            return planned, skipped
+        created = model.objects.count() - before
+        return created, skipped + planned - created
 
     def handle(self, *args, **options):
-        with open(f'{settings.BASE_DIR}/data/ingredients.json', 'rb') as f:
-            data = json.load(f)
-            for value in data:
-                success_msg = (f'Ингредиент {value["name"]} '
-                               f'{value["measurement_unit"]} добавлен!')
-                failure_msg = (f'Ингредиент {value["name"]} '
-                               f'{value["measurement_unit"]} уже есть в базе!')
-                obj, created = Ingredient.objects.get_or_create(
-                    name=value['name'],
-                    measurement_unit=value['measurement_unit']
-                )
-                print(success_msg if created else failure_msg)
-
-        with open(f'{settings.BASE_DIR}/data/tags.json', 'rb') as f:
-            data = json.load(f)
-            for value in data:
-                success_msg = (f'Тег {value["name"]} {value["color"]} '
-                               f'{value["slug"]} добавлен!')
-                failure_msg = (f'Тег {value["name"]} {value["color"]} '
-                               f'{value["slug"]} уже есть в базе!')
-                obj, created = Tag.objects.get_or_create(
-                    name=value['name'],
-                    color=value['color'],
-                    slug=value['slug']
-                )
-                print(success_msg if created else failure_msg)
-
-        print('Заполнение прошло успешно!')
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        ingredient_fields = ('name', 'measurement_unit')
+        tag_fields = ('name', 'color', 'slug')
+        with transaction.atomic():
+            created, skipped = self.load(
+                Ingredient,
+                iter_rows(options['ingredients'], ingredient_fields),
+                ingredient_fields, 'name', batch_size, dry_run
+            )
+            self.stdout.write(f'Ингредиенты: добавлено {created}, '
+                              f'уже в базе {skipped}')
+            created, skipped = self.load(
+                Tag, iter_rows(options['tags'], tag_fields), tag_fields,
+                'slug', batch_size, dry_run
+            )
+            self.stdout.write(f'Теги: добавлено {created}, '
+                              f'уже в базе {skipped}')
+            if dry_run:
+                transaction.set_rollback(True)
+            else:
+                ResourceVersion.objects.bump('ingredients', 'tags')
+        self.stdout.write(self.style.SUCCESS(
+            'Проверка завершена, база не изменена.' if dry_run
+            else 'Заполнение прошло успешно!'))
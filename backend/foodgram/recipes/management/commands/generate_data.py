@@ -0,0 +1,167 @@
+import random
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import CustomUser, Follow
+
+
+class ZipfChoice:
+    """Picks items with probability proportional to 1 / rank ** exponent."""
+
+    def __init__(self, items, exponent, rng):
+        self.items = items
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(items) + 1)))
+
+    def __call__(self, count=1):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights,
+                                k=count)
+
+
+class Command(BaseCommand):
+    help = ('Генерирует синтетические данные для нагрузочного '
+            'тестирования: пользователей, рецепты, избранное, корзины '
+            'и подписки с неравномерным распределением популярности.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int,
+                            default=8)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def bulk_create(self, model, objects):
+        """Inserts batch by batch: bulk_create would list all objects."""
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def create_users(self, count):
+        password = make_password('password')
+        prefix = f'load{timezone.now():%Y%m%d%H%M%S}'
+        self.bulk_create(CustomUser, (
+            CustomUser(username=f'{prefix}_{index}',
+                       email=f'{prefix}_{index}@example.com',
+                       first_name='Имя', last_name='Фамилия',
+                       password=password)
+            for index in range(count)
+        ))
+        return list(CustomUser.objects.filter(
+            username__startswith=f'{prefix}_').values_list('id', flat=True))
+
+    def create_recipes(self, count, authors, tag_ids, ingredient_ids,
+                       per_recipe):
+        start = timezone.now() - timezone.timedelta(days=365)
+        step = timezone.timedelta(days=365) / max(count, 1)
+        first_id = (Recipe.objects.order_by('-id').values_list(
+            'id', flat=True).first() or 0) + 1
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            recipes = Recipe.objects.bulk_create([
+                Recipe(author_id=author_id, name=f'Рецепт {index}',
+                       text='Описание рецепта', image='',
+                       cooking_time=self.rng.randint(5, 180))
+                for index, author_id in enumerate(
+                    authors(size), start=offset)
+            ])
+            # pub_date is auto_now_add, so the spread is set afterwards.
+            for index, recipe in enumerate(recipes, start=offset):
+                recipe.pub_date = start + step * index
+            Recipe.objects.bulk_update(recipes, ['pub_date'])
+        recipe_ids = list(Recipe.objects.filter(
+            id__gte=first_id).values_list('id', flat=True))
+        per_recipe = min(per_recipe, len(ingredient_ids))
+        self.bulk_create(RecipeIngredient, (
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=self.rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in self.rng.sample(ingredient_ids, per_recipe)
+        ))
+        through = Recipe.tags.through
+        self.bulk_create(through, (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, self.rng.randint(1, len(tag_ids)))
+        ))
+        return recipe_ids
+
+    def create_pairs(self, model, field, count, users, targets,
+                     exclude_self=False):
+        pairs = set()
+        attempts = 0
+        while len(pairs) < count and attempts < count * 3:
+            attempts += 1
+            user_id, target_id = users(), targets()[0]
+            if not exclude_self or user_id != target_id:
+                pairs.add((user_id, target_id))
+        self.bulk_create(model, (
+            model(user_id=user_id, **{f'{field}_id': target_id})
+            for user_id, target_id in pairs
+        ))
+        return len(pairs)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if not Ingredient.objects.exists() or not Tag.objects.exists():
+            call_command('fill_db', stdout=self.stdout)
+        ingredient_ids = list(Ingredient.objects.values_list('id',
+                                                             flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if options['users'] < 2:
+            raise CommandError('Нужно как минимум два пользователя.')
+
+        with transaction.atomic():
+            user_ids = self.create_users(options['users'])
+            self.rng.shuffle(user_ids)
+            authors = ZipfChoice(user_ids, options['skew'], self.rng)
+            recipe_ids = self.create_recipes(
+                options['recipes'], authors, tag_ids, ingredient_ids,
+                options['ingredients_per_recipe']
+            )
+            self.rng.shuffle(recipe_ids)
+            popular_recipes = ZipfChoice(recipe_ids, options['skew'],
+                                         self.rng)
+            heavy_users = ZipfChoice(user_ids, options['skew'], self.rng)
+
+            def any_user():
+                return self.rng.choice(user_ids)
+
+            def heavy_user():
+                return heavy_users()[0]
+
+            favorites = self.create_pairs(Favorite, 'recipe',
+                                          options['favorites'], any_user,
+                                          popular_recipes)
+            carts = self.create_pairs(ShoppingCart, 'recipe',
+                                      options['carts'], heavy_user,
+                                      popular_recipes)
+            follows = self.create_pairs(Follow, 'author',
+                                        options['follows'], any_user,
+                                        authors, exclude_self=True)
+            call_command('rebuild_shopping_lists', stdout=self.stdout)
+            call_command('recount_counters', stdout=self.stdout)
+            call_command('rebuild_timelines', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}, избранного: {favorites}, '
+            f'корзин: {carts}, подписок: {follows}'))
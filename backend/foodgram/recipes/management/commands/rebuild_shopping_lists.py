@@ -0,0 +1,97 @@
+from functools import reduce
+from operator import or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, PositiveIntegerField, Q, Sum, Value, When
+
+from recipes.models import RecipeIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Исправляет расхождения таблицы списков покупок с корзинами '
+            'или только проверяет их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, не изменяя данные.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def get_live_totals(self):
+        return RecipeIngredient.objects.filter(
+            recipe__cart_recipe__isnull=False
+        ).values_list('recipe__cart_recipe__user', 'ingredient').annotate(
+            total=Sum('amount')).order_by()
+
+    def get_batches(self, items, batch_size):
+        items = list(items)
+        for start in range(0, len(items), batch_size):
+            yield items[start:start + batch_size]
+
+    def unchanged(self, items):
+        """Matches the stored rows that still hold the totals read."""
+        return reduce(or_, (Q(pk=pk, total_amount=total)
+                            for pk, total in items))
+
+    def fix(self, live, stored, drift, batch_size):
+        """
+        Writes only the drifted rows. Updates and deletes apply to rows
+        still holding the total that was read, so a cart change committed
+        meanwhile is kept; returns the number of rows left as they were.
+        """
+        skipped = 0
+        to_delete = [stored[key] for key in drift if key not in live]
+        to_update = [(*stored[key], live[key]) for key in drift
+                     if key in live and key in stored]
+        to_create = [key for key in drift if key not in stored]
+        for batch in self.get_batches(to_delete, batch_size):
+            deleted, _ = ShoppingListItem.objects.filter(
+                self.unchanged(batch)).delete()
+            skipped += len(batch) - deleted
+        for batch in self.get_batches(to_update, batch_size):
+            updated = ShoppingListItem.objects.filter(self.unchanged(
+                (pk, total) for pk, total, _ in batch)).update(
+                total_amount=Case(
+                    *(When(pk=pk, then=Value(new_total))
+                      for pk, _, new_total in batch),
+                    output_field=PositiveIntegerField()))
+            skipped += len(batch) - updated
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                              total_amount=live[user_id, ingredient_id])
+             for user_id, ingredient_id in to_create),
+            batch_size=batch_size, ignore_conflicts=True
+        )
+        return skipped
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            live = {(user_id, ingredient_id): total
+                    for user_id, ingredient_id, total
+                    in self.get_live_totals()}
+            stored = {
+                (user_id, ingredient_id): (pk, total)
+                for pk, user_id, ingredient_id, total
+                in ShoppingListItem.objects.values_list(
+                    'pk', 'user_id', 'ingredient_id', 'total_amount')
+            }
+            drift = {key for key in live.keys() | stored.keys()
+                     if live.get(key) != stored.get(key, (None, None))[1]}
+            self.stdout.write(f'Позиций в корзинах: {len(live)}, '
+                              f'в таблице: {len(stored)}, '
+                              f'расхождений: {len(drift)}')
+            if options['check']:
+                if drift:
+                    raise CommandError('Таблица списков покупок '
+                                       'расходится с корзинами '
+                                       'пользователей.')
+                return
+            skipped = self.fix(live, stored, drift, options['batch_size'])
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Изменены во время пересборки, оставлены как есть: '
+                f'{skipped}; запустите команду ещё раз.'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено позиций: {len(drift) - skipped}'))
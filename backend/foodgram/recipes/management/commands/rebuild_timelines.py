@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import TimelineEntry
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = ('Заново заполняет ленты подписок последними рецептами '
+            'авторов, на которых подписаны пользователи.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TimelineEntry.objects.all().delete()
+            follows = Follow.objects.select_related('author').order_by('pk')
+            last_pk = 0
+            while True:
+                batch = list(follows.filter(
+                    pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                for follow in batch:
+                    TimelineEntry.objects.backfill(follow.user_id,
+                                                   follow.author)
+                last_pk = batch[-1].pk
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {TimelineEntry.objects.count()}'))
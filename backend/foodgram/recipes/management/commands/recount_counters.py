@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import CustomUser, Follow
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (CustomUser, 'recipes_count', Recipe, 'author'),
+    (CustomUser, 'followers_count', Follow, 'author'),
+)
+
+
+def get_actual_count(related, key):
+    return Coalesce(
+        Subquery(related.objects.filter(**{key: OuterRef('pk')})
+                 .order_by().values(key).annotate(total=Count('pk'))
+                 .values('total')),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики избранного, корзин, рецептов и подписчиков '
+            'с данными и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, не изменяя данные.'
+        )
+
+    def handle(self, *args, **options):
+        drift = 0
+        for model, field, related, key in COUNTERS:
+            stale = model._base_manager.annotate(
+                actual=get_actual_count(related, key)
+            ).exclude(**{field: F('actual')}).values('pk')
+            count = stale.count()
+            drift += count
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}, {field}: '
+                f'расхождений {count}')
+            if count and not options['check']:
+                model._base_manager.filter(pk__in=stale).update(
+                    **{field: get_actual_count(related, key)})
+        if options['check'] and drift:
+            raise CommandError('Счётчики расходятся с данными.')
+        if not options['check']:
+            self.stdout.write(self.style.SUCCESS('Счётчики сверены!'))
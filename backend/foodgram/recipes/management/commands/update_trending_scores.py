@@ -0,0 +1,93 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from recipes.models import Favorite, Recipe, ResourceVersion, ShoppingCart
+from recipes.signals import trending_scores_updated
+
+RESOURCE = 'trending'
+
+EVENTS = (
+    (Favorite, 'favorite'),
+    (ShoppingCart, 'shopping_cart'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает трендовый рейтинг рецептов по недавним '
+            'добавлениям в избранное и корзину.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать рейтинг с нуля за окно TRENDING_WINDOW.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def decay(self, seconds):
+        return 0.5 ** (seconds / settings.TRENDING_HALF_LIFE)
+
+    def get_increments(self, since, now):
+        """
+        Decayed activity per recipe. Events are grouped by hour, so the
+        work depends on the number of active recipes, not of events.
+        """
+        increments = defaultdict(float)
+        for model, event in EVENTS:
+            weight = settings.TRENDING_WEIGHTS[event]
+            rows = model.objects.filter(
+                created_at__gt=since, created_at__lte=now
+            ).annotate(hour=TruncHour('created_at')).values(
+                'recipe_id', 'hour').annotate(total=Count('pk')).order_by()
+            for row in rows.iterator():
+                age = (now - max(row['hour'], since)).total_seconds()
+                increments[row['recipe_id']] += (
+                    weight * row['total'] * self.decay(age))
+        return increments
+
+    def apply(self, increments, batch_size):
+        items = list(increments.items())
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            Recipe.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                trending_score=F('trending_score') + Case(
+                    *(When(pk=pk, then=Value(increment))
+                      for pk, increment in batch),
+                    default=Value(0.0), output_field=FloatField()
+                )
+            )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        state = ResourceVersion.objects.get_versions([RESOURCE]).get(
+            RESOURCE)
+        rebuild = options['rebuild'] or state is None
+        with transaction.atomic():
+            if rebuild:
+                since = now - timedelta(seconds=settings.TRENDING_WINDOW)
+                Recipe.objects.filter(trending_score__gt=0).update(
+                    trending_score=0)
+            else:
+                since = state[1]
+                Recipe.objects.filter(
+                    trending_score__gt=0,
+                    trending_score__lt=settings.TRENDING_MIN_SCORE
+                ).update(trending_score=0)
+                Recipe.objects.filter(trending_score__gt=0).update(
+                    trending_score=F('trending_score') * self.decay(
+                        (now - since).total_seconds()))
+            increments = self.get_increments(since, now)
+            self.apply(increments, options['batch_size'])
+            ResourceVersion.objects.bump(RESOURCE)
+            ResourceVersion.objects.filter(resource=RESOURCE).update(
+                updated_at=now)
+            trending_scores_updated.send(sender=Recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Трендовый рейтинг обновлён, активных рецептов: '
+            f'{len(increments)}'))
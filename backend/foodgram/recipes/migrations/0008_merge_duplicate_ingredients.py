@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:19
+
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit').annotate(
+        keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        keep_id = group['keep_id']
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=keep_id).values_list('pk', flat=True))
+        RecipeIngredient.objects.filter(
+            ingredient__in=duplicate_ids).update(ingredient=keep_id)
+        for item in ShoppingListItem.objects.filter(
+                ingredient__in=duplicate_ids):
+            updated = ShoppingListItem.objects.filter(
+                user=item.user_id, ingredient=keep_id
+            ).update(total_amount=F('total_amount') + item.total_amount)
+            if updated:
+                item.delete()
+            else:
+                item.ingredient_id = keep_id
+                item.save(update_fields=['ingredient'])
+        Ingredient.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
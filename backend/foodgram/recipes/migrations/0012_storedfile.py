@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:27
+
+from collections import Counter
+
+from django.db import migrations, models
+
+import recipes.storage
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    StoredFile = apps.get_model('recipes', 'StoredFile')
+    references = Counter()
+    for image, thumbnails in Recipe.objects.values_list(
+            'image', 'thumbnails').iterator():
+        references.update(set((thumbnails or {}).values()) | {image} - {''})
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name, refcount=count)
+         for name, count in references.items() if name),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Имя файла')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'Сохранённый файл',
+                'verbose_name_plural': 'Сохранённые файлы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Добавьте изображение Вашего блюда', null=True, storage=recipes.storage.get_recipe_storage, upload_to='recipes/images', verbose_name='Изображение блюда'),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'cart_count', 'recipes', 'ShoppingCart', 'recipe'),
+    ('users', 'CustomUser', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'CustomUser', 'followers_count', 'users', 'Follow', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, related_app, related_model, key in COUNTERS:
+        related = apps.get_model(related_app, related_model)
+        apps.get_model(app, model).objects.update(**{field: Coalesce(
+            Subquery(related.objects.filter(**{key: OuterRef('pk')})
+                     .order_by().values(key).annotate(total=Count('pk'))
+                     .values('total')),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_storedfile'),
+        ('users', '0003_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество добавлений в корзину'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
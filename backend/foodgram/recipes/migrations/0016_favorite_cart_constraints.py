@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:32
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Sum, Value
+from django.db.models.functions import Greatest
+
+
+def delete_duplicates(apps, schema_editor):
+    """
+    Keeps the oldest row of every duplicate group and takes the extra rows
+    back out of the counters and the shopping lists they were added to.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    for model_name, counter in (('Favorite', 'favorites_count'),
+                                ('ShoppingCart', 'cart_count')):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values('user', 'recipe').annotate(
+            keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+        for group in duplicates:
+            extra = group['total'] - 1
+            model.objects.filter(
+                user=group['user'], recipe=group['recipe']
+            ).exclude(pk=group['keep_id']).delete()
+            Recipe.objects.filter(pk=group['recipe']).update(
+                **{counter: Greatest(F(counter) - extra, Value(0))})
+            if model_name != 'ShoppingCart':
+                continue
+            amounts = RecipeIngredient.objects.filter(
+                recipe=group['recipe']).values('ingredient').annotate(
+                amount=Sum('amount')).order_by()
+            for item in amounts:
+                ShoppingListItem.objects.filter(
+                    user=group['user'], ingredient=item['ingredient']
+                ).update(total_amount=Greatest(
+                    F('total_amount') - item['amount'] * extra, Value(0)))
+            ShoppingListItem.objects.filter(
+                user=group['user'], total_amount=0).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_timelineentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
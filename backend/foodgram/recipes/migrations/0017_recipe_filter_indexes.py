@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+# Filters by tag look up the auto-created M2M table by tag first; Django
+# only indexes it by (recipe_id, tag_id) and by each column alone.
+CREATE_TAGS_INDEX = (
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_tags_tag_recipe_idx '
+    'ON recipes_recipe_tags (tag_id, recipe_id);'
+)
+DROP_TAGS_INDEX = 'DROP INDEX IF EXISTS recipes_recipe_tags_tag_recipe_idx;'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_favorite_cart_constraints'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.RunSQL(CREATE_TAGS_INDEX, DROP_TAGS_INDEX),
+    ]
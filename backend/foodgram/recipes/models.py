@@ -1,9 +1,125 @@
+import uuid
+
 from colorfield.fields import ColorField
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Case, Exists, F, OuterRef, Prefetch, Q, Value,
+                              When)
+from django.db.models.functions import Cast, Concat, Greatest
+from django.utils import timezone
+
+from recipes.storage import get_recipe_storage
+from users.models import CounterFieldsMixin, CustomUser, Follow
+
+
+class StoredFileQuerySet(models.QuerySet):
+    def touch(self, names, delta=0):
+        """Registers the files and moves their reference counts."""
+        names = set(names) - {''}
+        if not names:
+            return
+        if not delta:
+            # Registering alone only refreshes updated_at: one upsert.
+            self.bulk_create([self.model(name=name) for name in names],
+                             update_conflicts=True, unique_fields=['name'],
+                             update_fields=['updated_at'])
+            return
+        self.bulk_create([self.model(name=name) for name in names],
+                         ignore_conflicts=True)
+        queryset = self.filter(name__in=names)
+        if delta < 0:
+            queryset = queryset.filter(refcount__gte=-delta)
+        queryset.update(refcount=F('refcount') + delta,
+                        updated_at=timezone.now())
+
+    def acquire(self, names):
+        self.touch(names, 1)
+
+    def release(self, names):
+        self.touch(names, -1)
+
+
+class StoredFile(models.Model):
+    """Reference count of a file in the content-addressed storage."""
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла'
+    )
+    refcount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество ссылок'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Дата изменения'
+    )
+
+    objects = StoredFileQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Сохранённый файл'
+        verbose_name_plural = 'Сохранённые файлы'
+
+    def __str__(self):
+        return f'{self.name}: {self.refcount}'
+
+
+class ResourceVersionQuerySet(models.QuerySet):
+    def bump(self, *resources):
+        now = timezone.now()
+        for resource in resources:
+            updated = self.filter(resource=resource).update(
+                version=F('version') + 1, updated_at=now)
+            if not updated:
+                self.get_or_create(resource=resource,
+                                   defaults={'version': 1, 'updated_at': now})
 
-from users.models import CustomUser
+    def bump_user(self, user_id):
+        self.bump(f'user:{user_id}')
+
+    def of_user(self, user_id):
+        """Version of one user's profile; user_id may be an OuterRef."""
+        return self.filter(resource=Concat(
+            Value('user:'), Cast(user_id, output_field=models.CharField())))
+
+    def get_versions(self, resources):
+        return {
+            resource: (version, updated_at)
+            for resource, version, updated_at in self.filter(
+                resource__in=resources).values_list(
+                'resource', 'version', 'updated_at')
+        }
+
+
+class ResourceVersion(models.Model):
+    """
+    Change counter of a resource type, used for conditional GET requests.
+    """
+    resource = models.CharField(
+        max_length=50,
+        primary_key=True,
+        verbose_name='Ресурс'
+    )
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+    updated_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Дата изменения'
+    )
+
+    objects = ResourceVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия ресурса'
+        verbose_name_plural = 'Версии ресурсов'
+
+    def __str__(self):
+        return f'{self.resource}: {self.version}'
 
 
 class Tag(models.Model):
@@ -52,12 +168,41 @@ class Ingredient(models.Model):
         ordering = ('name',)
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.name} {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(favorited=Value(False),
+                                 in_shopping_cart=Value(False))
+        return self.annotate(
+            favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        )
+
+    def with_related(self, user):
+        return self.prefetch_related(
+            'tags',
+            Prefetch('recipe_ingredient',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+            Prefetch('author',
+                     queryset=CustomUser.objects.with_subscription(user))
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         to=CustomUser,
         on_delete=models.CASCADE,
@@ -72,11 +217,17 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images',
+        storage=get_recipe_storage,
         blank=True,
         null=True,
         verbose_name='Изображение блюда',
         help_text='Добавьте изображение Вашего блюда'
     )
+    thumbnails = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Миниатюры'
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
         help_text='Введите описание рецепта'
@@ -108,15 +259,60 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации рецепта'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения рецепта'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество добавлений в избранное'
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество добавлений в корзину'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        verbose_name='Популярность за последнее время'
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count', 'cart_count', 'trending_score')
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=('-pub_date', '-id'),
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=('-favorites_count', '-id'),
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=('-trending_score', '-id'),
+                         name='recipe_trending_score_idx'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name[:30]
 
+    def get_file_names(self):
+        names = set((self.thumbnails or {}).values())
+        if self.image:
+            names.add(self.image.name)
+        return names
+
+
+class RecipeIngredientQuerySet(models.QuerySet):
+    def amounts(self, recipe):
+        amounts = {}
+        for ingredient_id, amount in self.filter(recipe=recipe).values_list(
+                'ingredient_id', 'amount'):
+            amounts[ingredient_id] = amounts.get(ingredient_id, 0) + amount
+        return amounts
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -142,6 +338,8 @@ class RecipeIngredient(models.Model):
         verbose_name='Количество ингредиентов'
     )
 
+    objects = RecipeIngredientQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
@@ -164,11 +362,22 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name='is_favorited'
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            )
+        ]
 
     def __str__(self):
         return (
@@ -188,14 +397,379 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='cart_recipe'
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart'
+            )
+        ]
 
     def __str__(self):
         return (
             f'Пользователь: {self.user.username} - '
             f'Рецепт: {self.recipe.name}'
         )
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    def shopping_list(self, user):
+        return self.filter(user=user).values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+            amount=F('total_amount')
+        ).order_by('name')
+
+    def apply_deltas(self, user_ids, deltas):
+        """Adds signed amounts to the users' shopping lists."""
+        deltas = {key: value for key, value in deltas.items() if value}
+        user_ids = list(user_ids)
+        if not deltas or not user_ids:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                (self.model(user_id=user_id, ingredient_id=ingredient_id,
+                            total_amount=0)
+                 for user_id in user_ids
+                 for ingredient_id, delta in deltas.items() if delta > 0),
+                ignore_conflicts=True
+            )
+            items = self.filter(user__in=user_ids, ingredient__in=deltas)
+            items.update(total_amount=Greatest(
+                F('total_amount') + Case(
+                    *(When(ingredient_id=ingredient_id, then=Value(delta))
+                      for ingredient_id, delta in deltas.items()),
+                    default=Value(0)
+                ),
+                Value(0),
+                output_field=models.PositiveIntegerField()
+            ))
+            items.filter(total_amount=0).delete()
+
+    def add_recipe(self, user_id, recipe_id):
+        self.apply_deltas([user_id],
+                          RecipeIngredient.objects.amounts(recipe_id))
+
+    def remove_recipe(self, user_id, recipe_id):
+        amounts = RecipeIngredient.objects.amounts(recipe_id)
+        self.apply_deltas([user_id], {key: -value
+                                      for key, value in amounts.items()})
+
+    def change_recipe(self, recipe, old_amounts, new_amounts=None):
+        """Applies an ingredient edit to every cart containing the recipe."""
+        if new_amounts is None:
+            new_amounts = RecipeIngredient.objects.amounts(recipe)
+        deltas = {
+            key: new_amounts.get(key, 0) - old_amounts.get(key, 0)
+            for key in new_amounts.keys() | old_amounts.keys()
+        }
+        self.apply_deltas(
+            ShoppingCart.objects.filter(recipe=recipe).order_by().values_list(
+                'user_id', flat=True).distinct(),
+            deltas
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        to=Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.user.username}: {self.ingredient.name} - '
+            f'{self.total_amount} {self.ingredient.measurement_unit}'
+        )
+
+
+class ShoppingListExportQuerySet(models.QuerySet):
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+    def finished(self, content_hash):
+        return self.filter(
+            content_hash=content_hash, status=self.model.DONE,
+            expires_at__gt=timezone.now()).exclude(file='')
+
+
+class ShoppingListExport(models.Model):
+    """PDF render job; identical lists share one job and one file."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Хеш содержимого'
+    )
+    rows = models.JSONField(
+        verbose_name='Позиции списка'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True,
+        verbose_name='Статус'
+    )
+    file = models.FileField(
+        upload_to='shopping_lists/',
+        blank=True,
+        verbose_name='Файл'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Ошибка'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Начало обработки'
+    )
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Окончание обработки'
+    )
+    expires_at = models.DateTimeField(
+        db_index=True,
+        verbose_name='Срок хранения'
+    )
+
+    objects = ShoppingListExportQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списков покупок'
+        ordering = ('-created_at',)
+
+    def __str__(self):
+        return f'{self.content_hash[:12]}: {self.status}'
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def get_followers_count(self, author_id):
+        """Read from the database: author objects may be stale copies."""
+        return CustomUser.objects.filter(pk=author_id).values_list(
+            'followers_count', flat=True).first() or 0
+
+    def iter_followers(self, author_id):
+        """Yields the author's follower IDs in batches."""
+        followers = Follow.objects.filter(author=author_id).values_list(
+            'user_id', flat=True).order_by('user_id')
+        last_id = 0
+        while True:
+            user_ids = list(followers.filter(
+                user_id__gt=last_id)[:settings.TIMELINE_BATCH_SIZE])
+            if not user_ids:
+                return
+            yield user_ids
+            last_id = user_ids[-1]
+
+    def fan_out(self, recipe):
+        """Writes the recipe into the followers' timelines."""
+        if (self.get_followers_count(recipe.author_id)
+                > settings.TIMELINE_FANOUT_LIMIT):
+            return
+        for user_ids in self.iter_followers(recipe.author_id):
+            self.bulk_create(
+                (self.model(user_id=user_id, recipe_id=recipe.pk,
+                            pub_date=recipe.pub_date)
+                 for user_id in user_ids),
+                ignore_conflicts=True
+            )
+
+    def catch_up(self, author_id):
+        """Queues a backfill once an unfollow drops the author to the limit."""
+        if (self.get_followers_count(author_id)
+                == settings.TIMELINE_FANOUT_LIMIT):
+            TimelineBackfill.objects.get_or_create(author_id=author_id)
+
+    def fill_followers(self, author_id):
+        """Writes the author's newest recipes into all followers' feeds."""
+        recipes = list(Recipe.objects.filter(author=author_id).order_by(
+            '-pub_date', '-id').values_list(
+            'pk', 'pub_date')[:settings.TIMELINE_BACKFILL_SIZE])
+        if not recipes:
+            return
+        for user_ids in self.iter_followers(author_id):
+            self.bulk_create(
+                (self.model(user_id=user_id, recipe_id=recipe_id,
+                            pub_date=pub_date)
+                 for user_id in user_ids for recipe_id, pub_date in recipes),
+                batch_size=settings.TIMELINE_BATCH_SIZE,
+                ignore_conflicts=True
+            )
+
+    def backfill(self, user_id, author):
+        if (self.get_followers_count(author.pk)
+                > settings.TIMELINE_FANOUT_LIMIT):
+            return
+        recipes = Recipe.objects.filter(author=author).order_by(
+            '-pub_date', '-id').values_list(
+            'pk', 'pub_date')[:settings.TIMELINE_BACKFILL_SIZE]
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe_id=recipe_id,
+                        pub_date=pub_date)
+             for recipe_id, pub_date in recipes),
+            ignore_conflicts=True
+        )
+
+    def prune(self, user_id, author_id):
+        self.filter(user_id=user_id, recipe__author_id=author_id).delete()
+
+    def get_feed_keys(self, user, before=None, limit=10):
+        """(pub_date, recipe_id) keys of feed recipes older than before."""
+        entries = self.filter(user=user)
+        recipes = Recipe.objects.filter(author__in=Follow.objects.filter(
+            Q(author__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT)
+            | Q(author__timeline_backfill__isnull=False),
+            user=user
+        ).values('author'))
+        if before is not None:
+            pub_date, recipe_id = before
+            entries = entries.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lt=recipe_id))
+            recipes = recipes.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, pk__lt=recipe_id))
+        keys = set(entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id')[:limit])
+        keys.update(recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'pk')[:limit])
+        return sorted(keys, reverse=True)[:limit]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    recipe = models.ForeignKey(
+        to=Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=('user', '-pub_date', '-recipe'),
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class TimelineBackfillQuerySet(models.QuerySet):
+    def claim(self):
+        """Takes a free backfill or one whose worker has died."""
+        now = timezone.now()
+        stale = now - timezone.timedelta(
+            seconds=settings.TIMELINE_BACKFILL_TIMEOUT)
+        candidates = self.filter(
+            Q(started_at__isnull=True) | Q(started_at__lte=stale)
+        ).order_by('created_at').values_list('pk', 'started_at')[:10]
+        for pk, started_at in candidates:
+            if self.filter(pk=pk, started_at=started_at).update(
+                    started_at=now):
+                return self.get(pk=pk)
+        return None
+
+    def process(self, backfill):
+        """Fills the followers' timelines and removes the backfill."""
+        if (TimelineEntry.objects.get_followers_count(backfill.author_id)
+                <= settings.TIMELINE_FANOUT_LIMIT):
+            TimelineEntry.objects.fill_followers(backfill.author_id)
+        self.filter(pk=backfill.pk).delete()
+
+
+class TimelineBackfill(models.Model):
+    """Author whose followers' timelines still miss their recipes."""
+    author = models.OneToOneField(
+        to=CustomUser,
+        on_delete=models.CASCADE,
+        related_name='timeline_backfill',
+        verbose_name='Автор'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Начало обработки'
+    )
+
+    objects = TimelineBackfillQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Догрузка ленты'
+        verbose_name_plural = 'Догрузка лент'
+
+    def __str__(self):
+        return f'{self.author_id}: {self.created_at}'
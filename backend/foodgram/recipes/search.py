@@ -0,0 +1,158 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Upper
+
+from .models import Ingredient, Tag
+
+WORD_RE = re.compile(r'\w+')
+
+
+def get_trigrams(text):
+    """Splits text into trigrams the same way pg_trgm does."""
+    trigrams = set()
+    for word in WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+class SnapshotIndex:
+    """Process-local snapshot of a table, refreshed after a TTL."""
+    ttl_setting = None
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _get_snapshot(self):
+        ttl = self.ttl if self.ttl is not None else getattr(
+            settings, self.ttl_setting)
+        with self._lock:
+            if (self._snapshot is None
+                    or time.monotonic() - self._built_at > ttl):
+                self._built_at = time.monotonic()
+                self._snapshot = self._build()
+            return self._snapshot
+
+
+class IngredientIndex(SnapshotIndex):
+    """Sorted and trigram index of ingredient names."""
+    ttl_setting = 'INGREDIENT_INDEX_TTL'
+
+    def _build(self):
+        entries = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator()
+        )
+        keys = [entry[0] for entry in entries]
+        trigrams = [get_trigrams(key) for key in keys]
+        postings = defaultdict(list)
+        for index, entry_trigrams in enumerate(trigrams):
+            for trigram in entry_trigrams:
+                postings[trigram].append(index)
+        return keys, entries, trigrams, postings
+
+    @staticmethod
+    def _to_ingredient(entry):
+        _, pk, name, measurement_unit = entry
+        return Ingredient(id=pk, name=name, measurement_unit=measurement_unit)
+
+    def prefix(self, query, limit):
+        keys, entries, _, _ = self._get_snapshot()
+        query = query.lower()
+        result = []
+        for index in range(bisect_left(keys, query), len(keys)):
+            if len(result) >= limit or not keys[index].startswith(query):
+                break
+            result.append(self._to_ingredient(entries[index]))
+        return result
+
+    def search(self, query, limit, threshold=None):
+        """Prefix matches first, then substrings, then similar names."""
+        if threshold is None:
+            threshold = settings.INGREDIENT_SIMILARITY_THRESHOLD
+        keys, entries, trigrams, postings = self._get_snapshot()
+        query = query.lower()
+        query_trigrams = get_trigrams(query)
+        candidates = set()
+        for trigram in query_trigrams:
+            candidates.update(postings.get(trigram, ()))
+        candidates.update(range(bisect_left(keys, query),
+                                bisect_left(keys, query + '\uffff')))
+        ranked = []
+        for index in candidates:
+            key = keys[index]
+            common = len(query_trigrams & trigrams[index])
+            similarity = common / (
+                len(query_trigrams | trigrams[index]) or 1)
+            if key.startswith(query):
+                rank = 0
+            elif query in key:
+                rank = 1
+            elif similarity >= threshold:
+                rank = 2
+            else:
+                continue
+            ranked.append((rank, -similarity, key, index))
+        ranked.sort()
+        return [self._to_ingredient(entries[index])
+                for *_, index in ranked[:limit]]
+
+
+ingredient_index = IngredientIndex()
+
+
+class TagSlugIndex(SnapshotIndex):
+    """Map of tag slugs to ids, so recipe filters by tag need no query."""
+    ttl_setting = 'TAG_SLUG_INDEX_TTL'
+
+    def _build(self):
+        return dict(Tag.objects.values_list('slug', 'id'))
+
+    def choices(self):
+        return [(slug, slug) for slug in self._get_snapshot()]
+
+    def get_ids(self, slugs):
+        ids = self._get_snapshot()
+        return [ids[slug] for slug in slugs if slug in ids]
+
+
+tag_slug_index = TagSlugIndex()
+
+
+def search_ingredients(queryset, query, limit):
+    """Ranked substring and typo-tolerant ingredient search."""
+    if connection.vendor != 'postgresql':
+        return ingredient_index.search(query, limit)
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    upper_query = query.upper()
+    return queryset.annotate(upper_name=Upper('name')).filter(
+        Q(upper_name__contains=upper_query)
+        | Q(upper_name__trigram_similar=upper_query)
+    ).annotate(
+        rank=Case(
+            When(upper_name__startswith=upper_query, then=Value(0)),
+            When(upper_name__contains=upper_query, then=Value(1)),
+            default=Value(2)
+        ),
+        similarity=TrigramSimilarity('name', query)
+    ).order_by('rank', '-similarity', 'name')[:limit]
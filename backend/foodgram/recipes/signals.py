@@ -0,0 +1,203 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from users.models import CustomUser, Follow, change_counter
+
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ResourceVersion, ShoppingCart, ShoppingListItem,
+                     StoredFile, Tag, TimelineEntry)
+from .search import ingredient_index, tag_slug_index
+
+# Sent when recipe ingredients are edited outside of Recipe.save(),
+# e.g. by the admin inline; bulk writes do not fire per-row signals.
+# old_amounts holds the amounts per ingredient before the edit.
+recipe_ingredients_changed = Signal()
+# Sent by update_trending_scores after trending_score is recalculated.
+trending_scores_updated = Signal()
+
+
+@contextmanager
+def ingredients_changing(recipe_ids):
+    """Sends recipe_ingredients_changed for the recipes after the edit."""
+    old_amounts = {recipe_id: RecipeIngredient.objects.amounts(recipe_id)
+                   for recipe_id in set(recipe_ids) if recipe_id}
+    yield
+    for recipe_id, amounts in old_amounts.items():
+        recipe_ingredients_changed.send(sender=Recipe, recipe_id=recipe_id,
+                                        old_amounts=amounts)
+
+
+@contextmanager
+def adding_new_recipe_tags(recipe):
+    """Tags of a recipe just created, whose updated_at is still current."""
+    recipe._adding_new_tags = True
+    try:
+        yield
+    finally:
+        del recipe._adding_new_tags
+
+
+@receiver(connection_created)
+def set_trigram_similarity_threshold(sender, connection, **kwargs):
+    # The % operator of ingredient search compares with this threshold.
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET pg_trgm.similarity_threshold = %s',
+                           [settings.INGREDIENT_SIMILARITY_THRESHOLD])
+
+
+COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'cart_count',
+}
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipe(instance.user_id,
+                                            instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_recipe(instance.user_id,
+                                           instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+    ResourceVersion.objects.bump('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    tag_slug_index.invalidate()
+    ResourceVersion.objects.bump('tags')
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def bump_user_version(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    ResourceVersion.objects.bump_user(instance.pk)
+
+
+@receiver(recipe_ingredients_changed, sender=Recipe)
+def touch_recipe_on_ingredient_change(sender, recipe_id, **kwargs):
+    Recipe.objects.filter(pk=recipe_id).update(updated_at=timezone.now())
+
+
+@receiver(recipe_ingredients_changed, sender=Recipe)
+def update_shopping_lists_on_ingredient_change(sender, recipe_id,
+                                               old_amounts, **kwargs):
+    ShoppingListItem.objects.change_recipe(recipe_id, old_amounts)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_recipe_on_tags_change(sender, instance, action, pk_set,
+                                reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse and getattr(instance, '_adding_new_tags', False):
+        return
+    recipes = Recipe.objects.filter(pk__in=pk_set or ()) if reverse else (
+        Recipe.objects.filter(pk=instance.pk))
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Recipe)
+def remember_recipe_files(sender, instance, raw, **kwargs):
+    instance._old_file_names = set()
+    if instance.pk is None or raw:
+        return
+    old = Recipe.objects.filter(pk=instance.pk).values_list(
+        'image', 'thumbnails').first()
+    if old is not None:
+        image, thumbnails = old
+        instance._old_file_names = set((thumbnails or {}).values())
+        if image:
+            instance._old_file_names.add(image)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe_file_references(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    old_names = getattr(instance, '_old_file_names', set())
+    new_names = instance.get_file_names()
+    StoredFile.objects.acquire(new_names - old_names)
+    StoredFile.objects.release(old_names - new_names)
+
+
+@receiver(post_delete, sender=Recipe)
+def release_recipe_files(sender, instance, **kwargs):
+    StoredFile.objects.release(instance.get_file_names())
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_recipe_relation(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def uncount_recipe_relation(sender, instance, origin=None, **kwargs):
+    if not isinstance(origin, Recipe):
+        change_counter(Recipe, instance.recipe_id, COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def count_author_recipe(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        change_counter(CustomUser, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_author_recipe(sender, instance, **kwargs):
+    change_counter(CustomUser, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follower(sender, instance, created, **kwargs):
+    if created:
+        change_counter(CustomUser, instance.author_id, 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follower(sender, instance, **kwargs):
+    change_counter(CustomUser, instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.backfill(instance.user_id, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    TimelineEntry.objects.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def catch_up_timelines(sender, instance, **kwargs):
+    TimelineEntry.objects.catch_up(instance.author_id)
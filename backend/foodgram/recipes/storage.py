@@ -0,0 +1,59 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Names files by the SHA-256 of their content, so an image uploaded
+    again is stored once. Saved names are registered in StoredFile, whose
+    reference counts tell the garbage collector what can be removed.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, file_name = posixpath.split(name)
+        extension = os.path.splitext(file_name)[1].lower()
+        return posixpath.join(directory, digest.hexdigest() + extension)
+
+    def _save(self, name, content):
+        name = self.get_content_name(name, content)
+        apps.get_model('recipes', 'StoredFile').objects.touch([name])
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Concurrent uploads of one image race to the same name; the
+        # content is identical, so an atomic replace is enough.
+        descriptor, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
+
+
+recipe_storage = ContentAddressedStorage()
+
+
+def get_recipe_storage():
+    return recipe_storage
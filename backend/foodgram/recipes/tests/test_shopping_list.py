@@ -0,0 +1,80 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from api.tests.factories import create_ingredients, create_recipe, create_user
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+from recipes.signals import ingredients_changing
+
+
+class ShoppingListMaintenanceTest(TestCase):
+    """ShoppingListItem follows carts and ingredient edits."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', is_staff=True, is_superuser=True)
+        cls.users = [create_user(f'user{index}') for index in range(2)]
+        cls.salt, cls.water, cls.flour = create_ingredients(
+            'Соль', 'Вода', 'Мука')
+        cls.recipe = create_recipe(cls.admin, 'Хлеб', cooking_time=60)
+        cls.salt_row = RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=5)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.water, amount=300)
+        for user in cls.users:
+            ShoppingCart.objects.create(user=user, recipe=cls.recipe)
+
+    def get_lists(self):
+        return {
+            user.id: dict(ShoppingListItem.objects.filter(
+                user=user).values_list('ingredient__name', 'total_amount'))
+            for user in self.users
+        }
+
+    def assert_lists(self, expected):
+        self.assertEqual(self.get_lists(),
+                         {user.id: expected for user in self.users})
+        call_command('rebuild_shopping_lists', '--check',
+                     stdout=io.StringIO())
+
+    def test_cart_adds_ingredients(self):
+        self.assert_lists({'Соль': 5, 'Вода': 300})
+
+    def test_edit_inside_ingredients_changing(self):
+        with ingredients_changing([self.recipe.id]):
+            RecipeIngredient.objects.filter(ingredient=self.water).delete()
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=self.flour, amount=500)
+            self.salt_row.amount = 7
+            self.salt_row.save()
+        self.assert_lists({'Соль': 7, 'Мука': 500})
+
+    def test_admin_change_and_delete(self):
+        self.client.force_login(self.admin)
+        url = f'/admin/recipes/recipeingredient/{self.salt_row.id}/'
+        response = self.client.post(f'{url}change/', {
+            'recipe': self.recipe.id, 'ingredient': self.salt.id,
+            'amount': 12})
+        self.assertEqual(response.status_code, 302)
+        self.assert_lists({'Соль': 12, 'Вода': 300})
+        response = self.client.post(f'{url}delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assert_lists({'Вода': 300})
+
+    def test_rebuild_fixes_only_drifted_rows(self):
+        first, second = self.users
+        kept = ShoppingListItem.objects.get(user=first, ingredient=self.water)
+        ShoppingListItem.objects.filter(
+            user=first, ingredient=self.salt).update(total_amount=1)
+        ShoppingListItem.objects.filter(
+            user=second, ingredient=self.water).delete()
+        ShoppingListItem.objects.create(
+            user=second, ingredient=self.flour, total_amount=100)
+        stdout = io.StringIO()
+        call_command('rebuild_shopping_lists', '--batch-size', '1',
+                     stdout=stdout)
+        self.assertIn('Исправлено позиций: 3', stdout.getvalue())
+        self.assertEqual(ShoppingListItem.objects.get(
+            user=first, ingredient=self.water).pk, kept.pk)
+        self.assert_lists({'Соль': 5, 'Вода': 300})
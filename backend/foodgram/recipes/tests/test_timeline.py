@@ -0,0 +1,58 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from api.tests.factories import create_recipe, create_user
+from recipes.models import TimelineBackfill, TimelineEntry
+from users.models import CustomUser, Follow
+
+
+@override_settings(TIMELINE_FANOUT_LIMIT=2)
+class TimelineFanOutTest(TestCase):
+    """Timelines stay complete when an author crosses the fan-out limit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, *cls.followers = [create_user(f'user{index}')
+                                      for index in range(4)]
+        for follower in cls.followers:
+            Follow.objects.create(user=follower, author=cls.author)
+
+    def get_feed(self, user):
+        return [recipe_id for _, recipe_id in
+                TimelineEntry.objects.get_feed_keys(user)]
+
+    def test_recipes_above_limit_kept_after_unfollow(self):
+        recipe = create_recipe(self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        for follower in self.followers:
+            self.assertEqual(self.get_feed(follower), [recipe.pk])
+        Follow.objects.filter(user=self.followers[0]).delete()
+        self.assertTrue(TimelineBackfill.objects.filter(
+            author=self.author).exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        for follower in self.followers[1:]:
+            self.assertEqual(self.get_feed(follower), [recipe.pk])
+        call_command('process_shopping_list_exports', '--once',
+                     stdout=io.StringIO())
+        self.assertFalse(TimelineBackfill.objects.exists())
+        for follower in self.followers[1:]:
+            self.assertTrue(TimelineEntry.objects.filter(
+                user=follower, recipe=recipe).exists())
+            self.assertEqual(self.get_feed(follower), [recipe.pk])
+        self.assertEqual(self.get_feed(self.followers[0]), [])
+
+    def test_fan_out_reads_followers_count(self):
+        author = CustomUser.objects.get(pk=self.author.pk)
+        author.followers_count = 0
+        recipe = create_recipe(author)
+        self.assertFalse(TimelineEntry.objects.filter(
+            recipe=recipe).exists())
+
+    def test_backfill_reads_followers_count(self):
+        create_recipe(self.author)
+        author = CustomUser.objects.get(pk=self.author.pk)
+        author.followers_count = 0
+        TimelineEntry.objects.backfill(self.followers[0].pk, author)
+        self.assertFalse(TimelineEntry.objects.exists())
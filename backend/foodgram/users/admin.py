@@ -7,10 +7,12 @@ admin.site.empty_value_display = '-пусто-'
 
 @admin.register(CustomUser)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('id', 'username', 'email', 'is_superuser')
+    list_display = ('id', 'username', 'email', 'recipes_count',
+                    'followers_count', 'is_superuser')
     list_display_links = ('id', 'username')
     search_fields = ('email', 'username')
     list_filter = ('email', 'username')
+    readonly_fields = ('recipes_count', 'followers_count')
 
 
 @admin.register(Follow)
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:32
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Value
+from django.db.models.functions import Greatest
+
+
+def delete_invalid_follows(apps, schema_editor):
+    """Drops self-follows and repeated follows, fixing followers_count."""
+    CustomUser = apps.get_model('users', 'CustomUser')
+    Follow = apps.get_model('users', 'Follow')
+    removed = {}
+    for author_id in Follow.objects.filter(
+            user=F('author')).values_list('author', flat=True):
+        removed[author_id] = removed.get(author_id, 0) + 1
+    Follow.objects.filter(user=F('author')).delete()
+    duplicates = Follow.objects.values('user', 'author').annotate(
+        keep_id=Min('id'), total=Count('id')).filter(total__gt=1)
+    for group in duplicates:
+        Follow.objects.filter(
+            user=group['user'], author=group['author']
+        ).exclude(pk=group['keep_id']).delete()
+        removed[group['author']] = (removed.get(group['author'], 0)
+                                    + group['total'] - 1)
+    for author_id, count in removed.items():
+        CustomUser.objects.filter(pk=author_id).update(
+            followers_count=Greatest(F('followers_count') - count, Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_customuser_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_invalid_follows,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(check=models.Q(('user', models.F('author')), _negated=True), name='prevent_self_follow'),
+        ),
+    ]
@@ -1,12 +1,52 @@
 from django.conf import settings
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Value
 
 from .validators import UsernameValidator
 
 
-class CustomUser(AbstractUser):
+class CustomUserQuerySet(models.QuerySet):
+    def with_subscription(self, user):
+        if not user.is_authenticated:
+            return self.annotate(subscribed=Value(False))
+        return self.annotate(subscribed=Exists(Follow.objects.filter(
+            user=user, author=OuterRef('pk'))))
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
+    pass
+
+
+class CounterFieldsMixin:
+    """
+    Saves of a loaded object skip the counter columns, so a stale copy
+    never overwrites the F() increments made meanwhile.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            excluded = set(self.counter_fields) | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in excluded
+            ]
+        super().save(*args, **kwargs)
+
+
+def change_counter(model, pk, field, delta):
+    """Moves a counter column by one UPDATE, never below zero."""
+    queryset = model._base_manager.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+class CustomUser(CounterFieldsMixin, AbstractUser):
     username = models.CharField(
         max_length=settings.MAX_SIGNUP_PARAMS_LENGTH,
         unique=True,
@@ -40,6 +80,18 @@ class CustomUser(AbstractUser):
         verbose_name='Фамилия пользователя',
         help_text='Введите фамилию пользователя'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков'
+    )
+
+    objects = CustomUserManager()
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -70,6 +122,16 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='prevent_self_follow'
+            )
+        ]
 
     def __str__(self):
         return f'Автор: {self.author} - Подписчик: {self.user}'